@@ -34,6 +34,9 @@
     case some special functionality of the argparse library is needed.
 """
 
+import asyncio
+import inspect
+import re
 import sys
 from argparse import ArgumentParser, Namespace, ArgumentError
 from pathlib import Path
@@ -51,6 +54,42 @@ def default_error_handler(exc: ArgumentError):
     sys.stderr.flush()
 
 
+class StdioRedirect:
+    """
+    Context manager to temporarily replace :code:`sys.stdin`, :code:`sys.stdout` and :code:`sys.stderr`.
+
+    Streams that are :code:`None` are not replaced.
+    The object can be reused, but not entered again while it is active.
+
+    :param stdin: replacement for :code:`sys.stdin`
+    :param stdout: replacement for :code:`sys.stdout`
+    :param stderr: replacement for :code:`sys.stderr`
+    """
+
+    __slots__ = ("stdin", "stdout", "stderr", "_saved")
+
+    def __init__(self, stdin: Optional[TextIO] = None, stdout: Optional[TextIO] = None,
+                 stderr: Optional[TextIO] = None):
+        self.stdin = stdin
+        self.stdout = stdout
+        self.stderr = stderr
+        self._saved: Optional[Tuple[TextIO, TextIO, TextIO]] = None
+
+    def __enter__(self) -> 'StdioRedirect':
+        self._saved = (sys.stdin, sys.stdout, sys.stderr)
+        if self.stdin:
+            sys.stdin = self.stdin
+        if self.stdout:
+            sys.stdout = self.stdout
+        if self.stderr:
+            sys.stderr = self.stderr
+        return self
+
+    def __exit__(self, *_) -> None:
+        sys.stdin, sys.stdout, sys.stderr = self._saved
+        self._saved = None
+
+
 class ArgParseDecorator:
     """
     Build python :external:class:`argparse.ArgumentParser` from decorated functions.
@@ -115,6 +154,8 @@ class ArgParseDecorator:
         """
         The generated :external:class:`argparse.ArgumentParser` object.
 
+        It is only regenerated after a command, argument or alias has been added.
+
         This property is read only
         """
         argparser = self._rootnode.argumentparser
@@ -124,9 +165,9 @@ class ArgParseDecorator:
     def rootnode(self) -> ParserNode:
         """
         The root node of the :class:`~.parsernode.ParserNode` tree of commands.
-        While the tree can be modified care must be taken to regenerate it after modifications by
-        calling :meth:`~.parsernode.ParserNode.generate_parser` before calling :meth:`execute`.
-        
+        The tree can be modified. The :attr:`argumentparser` is generated once and reused by
+        :meth:`execute` until the tree is changed.
+
         This property is read only.
 
         :return: The root node of the :class:`~.parsernode.ParserNode` tree.
@@ -143,6 +184,10 @@ class ArgParseDecorator:
         See `Nested completion <https://python-prompt-toolkit.readthedocs.io/en/master/pages/asking_for_input.html#nested-completion>`_
         for details.
 
+        The dictionary is cached until a new command is added and shares its nested
+        dictionaries with the caches of all sub commands. It must not be modified, make a
+        (deep) copy first if, for example, additional completions are to be added.
+
         :returns: dict
         """
         return self.rootnode.get_command_dict()
@@ -151,7 +196,8 @@ class ArgParseDecorator:
     #    def command(self, f: Callable):
     def command(self, *args: Union[str, Callable], aliases: Union[str, Iterable[str]] = None,
                 ignore_annotations: bool = False,
-                ignore_docstring: bool = False, **kwargs: Any) -> Callable:
+                ignore_docstring: bool = False, memoize: Union[bool, int, None] = False,
+                **kwargs: Any) -> Callable:
         """
         Decorator to mark a method as an executable command.
 
@@ -162,6 +208,11 @@ class ArgParseDecorator:
         :param aliases: A list of aliases for this command
         :param ignore_annotations: If set to :code:`True` the annotations of the function signature should not be used.
         :param ignore_docstring: If set to :code:`True` the docstring is not parsed.
+        :param memoize: If set the results of the command are cached and repeated calls with the
+            same arguments return the cached result without calling the function.
+            Either :code:`True` for up to 128 cached results, the maximum number of cached results,
+            or :code:`None` for no limit. Only use this for commands without side effects.
+            See :meth:`~.parsernode.ParserNode.memoize`.
         :param args: Optional arguments that are passed directly to the
             :external:meth:`~argparse.ArgumentParser.add_subparsers` method of the underlying *ArgumentParser*.
         :param kwargs: Optional keyword arguments that are passed directly to the
@@ -172,6 +223,9 @@ class ArgParseDecorator:
 
         #        @functools.wraps(f)
         def decorator(func: Callable) -> Callable:
+            if memoize is not False and asyncio.iscoroutinefunction(inspect.unwrap(func)):
+                # check before the command is added to the tree
+                raise ValueError(f"The results of coroutine command '{func.__name__}' can not be cached.")
             node: ParserNode = self._node_from_func(func)
             if not (len(args) == 1 and len(kwargs) == 0 and callable(args[0])):
                 if aliases:
@@ -183,6 +237,8 @@ class ArgParseDecorator:
                 node.parser_args = (args, kwargs)
 
             node.function = func
+            if memoize is not False:
+                node.memoize(128 if memoize is True else memoize)
             return func
 
         # if command is used without (), then args is the decorated function,
@@ -193,6 +249,16 @@ class ArgParseDecorator:
             return decorator(args[0])
         return decorator
 
+    def clear_memo(self, command: Union[str, List[str]]) -> None:
+        """
+        Remove all cached results of a command that was decorated with :code:`memoize`.
+
+        :param command: The name of the command, or a list with the names of a command and its subcommands.
+        """
+        if not self._rootnode.has_node(command):
+            raise ValueError(f"Unknown command {command}")
+        self._rootnode.get_node(command).clear_memo()
+
     def add_argument(self, *args: str, **kwargs: Any) -> Callable:
         """
         Decorator to add an argument to the command.
@@ -283,47 +349,20 @@ class ArgParseDecorator:
         """
         arg_list = split_commandline(commandline)
 
-        old_stdin = sys.stdin
-        old_stdout = sys.stdout
-        old_stderr = sys.stderr
         result = None
 
-        try:
-            # redirect input and output if required
-            if stdin:
-                sys.stdin = stdin
-            if stdout:
-                sys.stdout = stdout
-            if stderr:
-                sys.stderr = stderr
-
-            argparser: ArgumentParser = self.argumentparser
-            named_args = argparser.parse_args(arg_list)
-            func: Callable = named_args.func
-            node: ParserNode = named_args.node
-            args, kwargs = get_arguments_from_namespace(named_args, node)
-
-            if node.bound_method and func != self.help:
-                if base is None:
-                    # do not pass None as self - this will propably cause errors further
-                    # down. Fail cleanly instead.
-                    raise ValueError(
-                        f"Method {func.__name__} is a bound method and requires the "
-                        f"'base' (self) parameter to be set.")
-                args.insert(0, base)
-
-            result = func(*args, **kwargs)
-
-        except (ArgumentError, TypeError) as err:
-            if error_handler:
-                error_handler(err)
-            else:
-                raise err  # just pass the exception to the caller
-        finally:
-            # restore in- and output
-            sys.stdin = old_stdin
-            sys.stdout = old_stdout
-            sys.stderr = old_stderr
+        # redirect input and output if required
+        with StdioRedirect(stdin, stdout, stderr):
+            try:
+                func, node, args, kwargs = self._parse_arguments(arg_list, base)
+
+                result = func(*args, **kwargs)
+
+            except (ArgumentError, TypeError) as err:
+                if error_handler:
+                    error_handler(err)
+                else:
+                    raise err  # just pass the exception to the caller
 
         return result
 
@@ -377,59 +416,57 @@ class ArgParseDecorator:
             is set to :code:`None`.
         """
 
-        # there is almost a complete duplicate of execute(), but I have found no elegant way
-        # to factor out the common parts.
+        # the parsing and the redirection are shared with execute(), only the call differs.
         arg_list = split_commandline(commandline)
 
-        old_stdin = sys.stdin
-        old_stdout = sys.stdout
-        old_stderr = sys.stderr
         result = None
 
-        try:
-            # redirect input and output if required
-            if stdin:
-                sys.stdin = stdin
-            if stdout:
-                sys.stdout = stdout
-            if stderr:
-                sys.stderr = stderr
-
-            argparser: ArgumentParser = self.argumentparser
-            named_args = argparser.parse_args(arg_list)
-            func: Callable = named_args.func
-            node: ParserNode = named_args.node
-            args, kwargs = get_arguments_from_namespace(named_args, node)
-
-            if node.bound_method and func != self.help:
-                if base is None:
-                    # do not pass None as self - this will propably cause errors further
-                    # down. Fail cleanly instead.
-                    raise ValueError(
-                        f"Method {func.__name__} is a bound method and requires the "
-                        f"'base' (self) parameter to be set.")
-                args.insert(0, base)
-
-            # handle both coroutines and normal functions
-            # so async and non-async commands can be mixed.
-            if node.coroutine:
-                result = await func(*args, **kwargs)
-            else:
-                result = func(*args, **kwargs)
+        # redirect input and output if required
+        with StdioRedirect(stdin, stdout, stderr):
+            try:
+                func, node, args, kwargs = self._parse_arguments(arg_list, base)
 
-        except ArgumentError as err:
-            if error_handler:
-                error_handler(err)
-            else:
-                raise err  # just pass the exception to the caller
-        finally:
-            # restore in- and output
-            sys.stdin = old_stdin
-            sys.stdout = old_stdout
-            sys.stderr = old_stderr
+                # handle both coroutines and normal functions
+                # so async and non-async commands can be mixed.
+                if node.coroutine:
+                    result = await func(*args, **kwargs)
+                else:
+                    result = func(*args, **kwargs)
+
+            except ArgumentError as err:
+                if error_handler:
+                    error_handler(err)
+                else:
+                    raise err  # just pass the exception to the caller
 
         return result
 
+    def _parse_arguments(self, arg_list: List[str], base: Optional[Any]) \
+            -> Tuple[Callable, ParserNode, List[Any], Dict[str, Any]]:
+        """
+        Parse the arguments of a command line and get the function to call with its arguments.
+
+        :param arg_list: the command line split into tokens
+        :param base: the :code:`self` of bound method commands
+        :return: command function, its node, positional arguments and keyword arguments
+        """
+        argparser: ArgumentParser = self.argumentparser
+        named_args = argparser.parse_args(arg_list)
+        func: Callable = named_args.func
+        node: ParserNode = named_args.node
+        args, kwargs = get_arguments_from_namespace(named_args, node)
+
+        if node.bound_method and func != self.help:
+            if base is None:
+                # do not pass None as self - this will propably cause errors further
+                # down. Fail cleanly instead.
+                raise ValueError(
+                    f"Method {func.__name__} is a bound method and requires the "
+                    f"'base' (self) parameter to be set.")
+            args.insert(0, base)
+
+        return func, node, args, kwargs
+
     def help(self, command: ZeroOrMore[str]) -> None:
         """
         Prints help for the given command.
@@ -485,15 +522,29 @@ def get_arguments_from_namespace(
     return args, kwargs
 
 
+SHLEX_WHITESPACE = " \t\r\n"
+"""The whitespace characters of :external:class:`shlex.shlex`."""
+
+SHLEX_WHITESPACE_SPLIT = re.compile(f"[{SHLEX_WHITESPACE}]+")
+
+SHLEX_SPECIAL_CHARS = re.compile(r"[\"'\\#]")
+"""The quote, escape and comment characters of :external:class:`shlex.shlex` in posix mode."""
+
+
 def split_commandline(cmdline: Union[str, List[str], Iterator[str]]) -> List[str]:
     if isinstance(cmdline, list) or isinstance(cmdline, Iterator):
         result_list = list(cmdline)
         # argv first item (command name) may be a full path. Reduce to just command name
         result_list[0] = Path(result_list[0]).stem
     elif isinstance(cmdline, str):
-        lexer = shlex(cmdline, posix=True)
-        lexer.whitespace_split = True  # otherwise it would split '-' into seperate tokens
-        result_list = list(lexer)
+        if not SHLEX_SPECIAL_CHARS.search(cmdline):
+            # Nothing quoted, escaped or commented: a plain whitespace split gives the same result as shlex
+            stripped = cmdline.strip(SHLEX_WHITESPACE)
+            result_list = SHLEX_WHITESPACE_SPLIT.split(stripped) if stripped else []
+        else:
+            lexer = shlex(cmdline, posix=True)
+            lexer.whitespace_split = True  # otherwise it would split '-' into seperate tokens
+            result_list = list(lexer)
     else:
         raise TypeError("Cmdline argument must be a string, a list of strings or a Iterator object.")
 
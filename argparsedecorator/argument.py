@@ -1,14 +1,50 @@
+import argparse
+import builtins
+import functools
+import re
+import sys
+from types import CodeType
 from argparse import Action
-from typing import Union, Any, Type, List, Tuple, Dict, Callable, TypeVar, Sequence
+from typing import Union, Any, Type, List, Tuple, Dict, Callable, TypeVar, Sequence, Optional
 
 T = TypeVar('T')
 
+# The fixed set of nargs and action strings passed to argparse.
+# Interned so that all arguments share the same string objects.
+NARGS_ZERO_OR_ONE = sys.intern("?")
+NARGS_ZERO_OR_MORE = sys.intern("*")
+NARGS_ONE_OR_MORE = sys.intern("+")
+NARGS_VALUES = frozenset((NARGS_ZERO_OR_ONE, NARGS_ZERO_OR_MORE, NARGS_ONE_OR_MORE))
+
+ACTION_STORE = sys.intern("store")
+ACTION_STORE_CONST = sys.intern("store_const")
+ACTION_STORE_TRUE = sys.intern("store_true")
+ACTION_STORE_FALSE = sys.intern("store_false")
+ACTION_APPEND = sys.intern("append")
+ACTION_APPEND_CONST = sys.intern("append_const")
+ACTION_COUNT = sys.intern("count")
+ACTION_EXTEND = sys.intern("extend")
+
+BUILTINS = vars(builtins)
+"""The builtin names, used to resolve type names like 'int' without eval()."""
+
+CONST_ACTIONS = frozenset((ACTION_STORE_CONST, ACTION_APPEND_CONST))
+"""Actions that store the default of the argument as their const value."""
+
+# argparse.BooleanOptionalAction (--foo / --no-foo) is only available in Python 3.9+
+BOOLEAN_OPTIONAL_ACTIONS = frozenset((argparse.BooleanOptionalAction,)) \
+    if hasattr(argparse, "BooleanOptionalAction") else frozenset()
+"""Actions that handle a bool default themselves and must not be replaced with store_true / store_false."""
+
 
 class Argument:
+    __slots__ = ("_name", "_globals", "_alias", "_action", "_nargs", "_const", "_default", "_type",
+                 "_choices", "_required", "_help", "_metavar", "_dest", "_command_line")
+
     def __init__(self, name: str, eval_globals: Dict[str, Any] = None):
         self.name = name
         self._globals = eval_globals if eval_globals else globals()
-        self._alias: List[str] = list()
+        self._alias: Tuple[str, ...] = ()
         self._action: Union[str, Action, None] = None
         self._nargs: Union[str, int, None] = None
         self._const: T = None
@@ -19,6 +55,7 @@ class Argument:
         self._help: str = ""
         self._metavar: Tuple[str] = tuple()
         self._dest: Union[str, None] = None
+        self._command_line: Optional[Tuple[List[str], Dict[str, Any]]] = None
 
     @property
     def name(self) -> str:
@@ -31,7 +68,9 @@ class Argument:
     def name(self, value: str) -> None:
         if not value.lstrip('-').isidentifier():
             raise ValueError(f"name '{value}' is not a valid name for an argument.")
-        self._name = value
+        # Names are used as dict keys and are shared by many commands, so intern them.
+        self._name = sys.intern(value)
+        self._command_line = None
 
     @property
     def alias(self) -> List[str]:
@@ -40,7 +79,7 @@ class Argument:
         This property is read only; new aliases can be added with :meth:'add_alias()'
         :return: List of other names for this argument
         """
-        return self._alias
+        return list(self._alias)
 
     def add_alias(self, alias: str):
         if self.positional:
@@ -48,10 +87,11 @@ class Argument:
                 "Alias names can only be added to flags or options, i.e. arguments starting with '-'")
         if not alias.startswith('-'):
             raise ValueError("An alias name must start with a '-'")
-        self._alias.append(alias)
+        self._alias += (sys.intern(alias),)
 
         # override the argparse default to use the longest optional name
-        self._dest = self.name.lstrip('-')
+        self._dest = sys.intern(self.name.lstrip('-'))
+        self._command_line = None
 
     @property
     def action(self) -> Union[str, Action]:
@@ -70,6 +110,7 @@ class Argument:
                     if self._action != new_action:
                         raise ValueError(f"new action does not match previously set action")
                 self._action = new_action
+                self._command_line = None
         except TypeError:
             raise TypeError("Action must be a string or a subtype of argparse.Action")
 
@@ -90,9 +131,10 @@ class Argument:
                 raise ValueError(f"Number of arguments must be 1 or greater, was {number}.")
             new_value = number
         else:
-            if number not in ['?', '*', '+']:
+            # check the type first, unhashable values can not be looked up in the set
+            if not isinstance(number, str) or number not in NARGS_VALUES:
                 raise ValueError(
-                    f"Number of arguments must be an int or either of '?', '*', '+', was f{number}")
+                    f"Number of arguments must be an int or either of '?', '*', '+', was {number}")
             new_value = number
 
         if self._nargs:
@@ -100,6 +142,7 @@ class Argument:
                 raise ValueError("New nargs does not match previously set nargs")
 
         self._nargs = new_value
+        self._command_line = None
 
     @property
     def const(self) -> T:
@@ -115,6 +158,7 @@ class Argument:
             if self._const != value:
                 raise ValueError("New const does not match previously set const")
         self._const = value
+        self._command_line = None
 
     @property
     def default(self) -> T:
@@ -130,6 +174,7 @@ class Argument:
             if self._default != value:
                 raise ValueError("New default does not match previously set default")
         self._default = value
+        self._command_line = None
 
     @property
     def type(self) -> Callable:
@@ -153,12 +198,17 @@ class Argument:
             # parsernode will need to remove a previously set type (should be 'bool', but not checked)
             # by setting the type to None.
             self._type = None
+            self._command_line = None
             return
 
         if isinstance(argtype, str):
             argtype = argtype.replace("builtins.",
                                       "")  # remove the "builtin." prefix as it causes errors
-            new_type: Callable = eval(argtype, self._globals)
+            # plain names like 'int' or 'MyType' are looked up like eval() would do,
+            # only real expressions like "FileType('w')" need to be compiled and evaluated.
+            new_type: Callable = self._globals.get(argtype, BUILTINS.get(argtype))
+            if new_type is None:
+                new_type = eval(compile_expression(argtype), self._globals)
         else:  # not a str
             if not callable(argtype):
                 raise TypeError(f"{argtype} is not callable")
@@ -171,6 +221,7 @@ class Argument:
                 raise TypeError(f"type has already been set to {self._type.__name__}")
 
         self._type = new_type
+        self._command_line = None
 
     @property
     def choices(self) -> Sequence:
@@ -180,7 +231,7 @@ class Argument:
     def choices(self, values: Union[str, Sequence]) -> None:
         if isinstance(values, str):
             try:
-                values = eval(values, self._globals)
+                values = evaluate_choices(values, self._globals)
             except SyntaxError as se:
                 raise ValueError("Cannot parse the choices.", se)
         try:
@@ -193,6 +244,7 @@ class Argument:
                 f"choices can be set only once. New values: {values}, old values: {self._choices}")
 
         self._choices = values
+        self._command_line = None
 
     @property
     def required(self) -> bool:
@@ -203,6 +255,7 @@ class Argument:
         if not isinstance(value, bool):
             raise ValueError(f"required must be either 'True' or 'False', was {value}")
         self._required = value
+        self._command_line = None
 
     @property
     def help(self) -> str:
@@ -213,6 +266,7 @@ class Argument:
         if not isinstance(text, str):
             text = str(text)
         self._help = text
+        self._command_line = None
 
     @property
     def metavar(self) -> Union[str, Tuple, None]:
@@ -240,6 +294,7 @@ class Argument:
             raise ValueError(
                 f"List of metavar entries ({num}) must match number of arguments in nargs ({self.nargs})")
         self._metavar = values
+        self._command_line = None
 
     @property
     def dest(self) -> Union[str, None]:
@@ -264,30 +319,33 @@ class Argument:
         return self._name.startswith('-')
 
     def get_command_line(self) -> Tuple[List[str], Dict[str, Any]]:
-        args: List[str] = list()
-        args.append(self.name)
-        args.extend(self._alias)
-        kwargs = {}
-        if self._action:
-            kwargs['action'] = self.action
-        if self._nargs:
-            kwargs['nargs'] = self.nargs
-        if self._const:
-            kwargs['const'] = self.const
-        if self._default is not None:
-            kwargs['default'] = self.default
-        if self._type:
-            kwargs['type'] = self.type
-        if self._choices:
-            kwargs['choices'] = self.choices
-        if self._required:
-            kwargs['required'] = self.required
-        if self._help:
-            kwargs['help'] = self.help
-        if self._metavar:
-            kwargs['metavar'] = self.metavar
-        if self._dest:
-            kwargs['dest'] = self.dest
+        """
+        Get the arguments for the :external:meth:`argparse.ArgumentParser.add_argument` call.
+
+        The result is cached until any property of this Argument is changed.
+        It must not be modified by the caller.
+
+        :return: tuple with a list of the names and a dict with all other set properties
+        """
+        if self._command_line is None:
+            self._command_line = self._build_command_line()
+        return self._command_line
+
+    def _build_command_line(self) -> Tuple[List[str], Dict[str, Any]]:
+        args: List[str] = [self._name, *self._alias]
+        # only the properties that have been set are passed to argparse.
+        # A default can be a falsy value like 0 or False, so for it only None means "not set"
+        kwargs = {key: value for key, value in (('action', self._action),
+                                                ('nargs', self._nargs),
+                                                ('const', self._const),
+                                                ('default', self._default),
+                                                ('type', self._type),
+                                                ('choices', self._choices),
+                                                ('required', self._required),
+                                                ('help', self._help),
+                                                ('metavar', self.metavar),
+                                                ('dest', self._dest))
+                  if (value is not None if key == 'default' else value)}
 
         return args, kwargs
 
@@ -325,7 +383,7 @@ class Argument:
 
         # copy all other kwargs to the argument.
         for key, value in kwargs.items():
-            if hasattr(argument, key):
+            if key in ARGUMENT_PROPERTIES:
                 setattr(argument, key, value)
 
         return argument
@@ -336,3 +394,52 @@ class Argument:
         kwargstr = ",".join(f"{key}={value}" for key, value in kwargs.items())
         result = argstr + ", " + kwargstr if kwargstr else argstr
         return result
+
+
+ARGUMENT_PROPERTIES = frozenset(key for key, value in vars(Argument).items()
+                                if isinstance(value, property) and value.fset)
+"""The settable properties of :class:`Argument`, used by :meth:`Argument.argument_from_args`."""
+
+SIMPLE_LITERAL = r"""\s*(?:[-+]?(?:0|[1-9][0-9]*)|'[^'\\]*'|"[^"\\]*")\s*"""
+"""An int or a string literal without escapes."""
+
+SIMPLE_CHOICES = re.compile(rf"(?:{SIMPLE_LITERAL},)+(?:{SIMPLE_LITERAL})?")
+"""A tuple of simple literals, i.e. with at least one comma."""
+
+SIMPLE_CHOICES_TOKEN = re.compile(r"([-+]?[0-9]+)|'([^'\\]*)'|\"([^\"\\]*)\"")
+
+RANGE_CHOICES = re.compile(r"\s*range\(\s*([-+]?[0-9]+)\s*,\s*([-+]?[0-9]+)\s*(?:,\s*([-+]?[0-9]+)\s*)?\)\s*")
+
+
+def evaluate_choices(expression: str, eval_globals: Dict[str, Any]) -> Any:
+    """
+    Evaluate a choices expression like :code:`"'foo', 'bar'"` or :code:`"range(1, 4)"`.
+
+    Tuples of int and string literals and :code:`range()` calls with int literals are parsed
+    directly. Anything else is passed to :code:`eval()` with the given globals.
+
+    :param expression: the choices as a Python expression
+    :param eval_globals: the globals for :code:`eval()`
+    :return: the result of the expression, usually a sequence
+    """
+    if SIMPLE_CHOICES.fullmatch(expression):
+        return tuple(int(m.group(1)) if m.lastindex == 1 else m.group(m.lastindex)
+                     for m in SIMPLE_CHOICES_TOKEN.finditer(expression))
+    m = RANGE_CHOICES.fullmatch(expression)
+    if m:
+        return range(*(int(g) for g in m.groups() if g is not None))
+    return eval(compile_expression(expression), eval_globals)
+
+
+@functools.lru_cache(maxsize=256)
+def compile_expression(expression: str) -> CodeType:
+    """
+    Compile an expression for :code:`eval()`.
+
+    The same expressions (e.g. from annotations shared by many commands) are evaluated over and over
+    again with different globals, so the compiled code is cached.
+
+    :param expression: a Python expression. Leading and trailing whitespace is ignored, like :code:`eval()` does.
+    :return: the code object
+    """
+    return compile(expression.strip(), "<expression>", "eval")
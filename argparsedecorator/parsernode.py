@@ -18,14 +18,20 @@ from __future__ import annotations
 
 import argparse
 import asyncio
+import functools
 import inspect
 import re
 import sys
+import types
+import weakref
 from argparse import ArgumentParser
-from typing import Union, Dict, Callable, Type, Any, Iterable, Optional, Mapping
+from typing import Union, Dict, Callable, Type, Any, Iterable, Optional, Mapping, MutableMapping, Tuple, \
+    get_args, get_origin
 
 from .annotations import *
-from .argument import Argument
+from .argument import Argument, NARGS_ZERO_OR_ONE, NARGS_ZERO_OR_MORE, NARGS_ONE_OR_MORE, \
+    ACTION_STORE, ACTION_STORE_CONST, ACTION_STORE_TRUE, ACTION_STORE_FALSE, ACTION_APPEND, \
+    ACTION_COUNT, ACTION_EXTEND, CONST_ACTIONS, BOOLEAN_OPTIONAL_ACTIONS, evaluate_choices
 from .nonexiting_argumentparser import NonExitingArgumentParser
 
 
@@ -49,6 +55,12 @@ class ParserNode:
                     for :external:meth:`argparse.ArgumentParser.add_subparsers` (all other nodes)
     """
 
+    __slots__ = ("_prog", "_title", "_parent", "_kwargs", "_children", "_aliases", "description",
+                 "_arguments", "_arguments_view", "positional_args", "optional_args", "parser_args",
+                 "_func", "_func_globals", "_func_has_self", "_func_coroutine", "_func_memo",
+                 "_parser", "_subparser", "_argparser_class", "_add_help", "_command_dict",
+                 "_ignore_annotations", "_ignore_docstring")
+
     def __init__(self,
                  title: Optional[str],
                  parent: 'ParserNode' = None,
@@ -72,6 +84,7 @@ class ParserNode:
 
         self._arguments: Dict[str, Argument] = {}
         """Registry for all arguments of this node"""
+        self._arguments_view: Mapping[str, Argument] = types.MappingProxyType(self._arguments)
 
         self.positional_args: List[str] = []
         """List of all positional (args) arguments of this node."""
@@ -79,14 +92,21 @@ class ParserNode:
         self.optional_args: List[str] = []
         """List of all optional (kwargs) arguments of this node."""
 
-        self._func: Callable[..., Any] = self.no_command
+        self.parser_args: Tuple[tuple, Dict[str, Any]] = ((), {})
+        """The arguments of the :meth:`~.argparse_decorator.ArgParseDecorator.command` decorator."""
+
+        self._func: Callable[..., Any] = ParserNode.no_command
         self._func_globals: Dict[str, Any] = {}
         self._func_has_self: bool = False
         self._func_coroutine: bool = False
+        self._func_memo: Optional[Callable[..., Any]] = None
 
         self._parser: Union[ArgumentParser, None] = None
         self._subparser: Union[object, None] = None
 
+        # cached result of get_command_dict(), reset when a sub command is added
+        self._command_dict: Optional[Dict[str, Optional[Dict]]] = None
+
         # The argumentparser class to use. Defaults to the provided NonExitingArgumentParser
         # but can be changed via the argparse_class property to use a custom subclass.
         self._argparser_class: Union[Type[ArgumentParser], None] = NonExitingArgumentParser
@@ -107,11 +127,11 @@ class ParserNode:
     @property
     def root(self) -> 'ParserNode':
         """The root node of the ParserNode hierarchy."""
-        if self._parent:
-            # traverse toward the root
-            return self._parent.root
-        # This node is the root.
-        return self
+        # traverse toward the root
+        node = self
+        while node._parent:
+            node = node._parent
+        return node
 
     @property
     def aliases(self) -> List[str]:
@@ -133,6 +153,7 @@ class ParserNode:
                     self._aliases.append(s)
             except TypeError as exc:
                 raise ValueError(f"'{value}' is not a valid string for an alias") from exc
+        self.invalidate_parser()
 
     @property
     def argumentparser(self) -> ArgumentParser:
@@ -143,11 +164,21 @@ class ParserNode:
         In case of any change to this Node or to the Tree this :external:class:`argparse.ArgumentParser`
         is regenerated.
         """
-        if not self._parser:
+        rootnode = self.root
+        if not rootnode._parser:
             # need to generate it first, starting at the root node
-            self.root.generate_parser(None)
+            rootnode.generate_parser(None)
         return self._parser
 
+    def invalidate_parser(self) -> None:
+        """
+        Mark the generated :external:class:`argparse.ArgumentParser` as outdated.
+
+        The whole parser tree is regenerated from the root node the next time the
+        :meth:`argumentparser` of any Node is accessed. Until then the existing parser is reused.
+        """
+        self.root._parser = None
+
     @property
     def argparser_class(self) -> Type[ArgumentParser]:
         """
@@ -167,9 +198,7 @@ class ParserNode:
     def argparser_class(self, new_class: Type[ArgumentParser]):
         rootnode = self.root
         rootnode._argparser_class = new_class
-        if rootnode._parser:  # has been generated before
-            # regenerate parser
-            rootnode.generate_parser(None)
+        self.invalidate_parser()
 
     @property
     def function(self) -> Callable[[Dict[str, Any]], Any]:
@@ -186,18 +215,22 @@ class ParserNode:
         if not callable(function):
             raise TypeError(f"'function' must be a callable function. Was a {type(function)}")
         self._func = function
+        self._func_memo = None
         if hasattr(function, '__globals__'):
             self._func_globals = function.__globals__  # type: ignore
         if hasattr(function, '__self__'):
             self._func_has_self = True
-        if asyncio.iscoroutinefunction(function):
-            self._func_coroutine = True
+        # Determined once here, so execute_async() does not need to inspect the function on every call.
+        # Look through decorators using functools.wraps, as their wrappers return the coroutine.
+        self._func_coroutine = asyncio.iscoroutinefunction(inspect.unwrap(function))
 
         self.analyse_signature(function)
 
         if not self._ignore_docstring:
             self.analyse_docstring(function)
 
+        self.invalidate_parser()
+
     @property
     def function_globals(self) -> Dict[str, Any]:
         """
@@ -238,14 +271,36 @@ class ParserNode:
         """
         return self._func_coroutine
 
+    def memoize(self, maxsize: Optional[int] = 128) -> None:
+        """
+        Cache the results of the command function.
+
+        Only use this for commands whose result depends on nothing but their arguments.
+        The arguments of cached calls, including :code:`self` for bound methods, are kept alive
+        by the cache. Calls with unhashable arguments, e.g. the list of a
+        :class:`~.annotations.OneOrMore` argument, are never cached.
+
+        :param maxsize: The maximum number of cached results, :code:`None` for no limit.
+        """
+        if self._func_coroutine:
+            raise ValueError(f"The results of coroutine command '{self.title}' can not be cached.")
+        self._func_memo = memoized(self._func, maxsize)
+        self.invalidate_parser()
+
+    def clear_memo(self) -> None:
+        """Remove all results cached by :meth:`memoize`."""
+        if self._func_memo:
+            self._func_memo.cache_clear()
+
     @property
-    def arguments(self) -> Dict[str, Argument]:
+    def arguments(self) -> Mapping[str, Argument]:
         """
-        A dictionary of all arguments set for this node.
+        A read only mapping of all arguments set for this node.
+        Use :meth:`add_argument` to add new arguments.
 
         Read only property.
         """
-        return self._arguments
+        return self._arguments_view
 
     @property
     def ignore_annotations(self) -> bool:
@@ -281,11 +336,11 @@ class ParserNode:
         :param name: name of the argument, e.g. :code:`--foo`
         :return: The :class:`.Argument` object or :code:`None` if no argument with this name.
         """
-        for n in [name, '-' + name, '--' + name]:
-            if n in self._arguments:
-                return self._arguments[n]
-
-        return None
+        arguments = self._arguments
+        arg = arguments.get(name)
+        if arg is None:
+            arg = arguments.get('-' + name) or arguments.get('--' + name)
+        return arg
 
     def add_argument(self, arg: Argument) -> None:
         """
@@ -295,29 +350,44 @@ class ParserNode:
 
         :param arg: single :class:`.Argument` object.
         """
+        if self._insert_argument(arg):
+            self.invalidate_parser()
+
+    def add_arguments(self, args: Iterable[Argument]) -> None:
+        """
+        Add multiple :class:`.Argument` objects to this node.
+
+        Like :meth:`add_argument`, but the parser is only invalidated once for all arguments.
+
+        :param args: iterable of :class:`.Argument` objects.
+        """
+        added = False
+        for arg in args:
+            added |= self._insert_argument(arg)
+        if added:
+            self.invalidate_parser()
+
+    def _insert_argument(self, arg: Argument) -> bool:
         if self.has_argument(arg):
             # There can be only one
             # raise ValueError(f"Argument '{arg.name} declared twice.")
             # Issue #5: raising an error prevents the "add_argument" decorator from working as documented.
             # instead just assume this new argument is a duplicate and ignore it
-            return
+            return False
         name = arg.name
-        self.arguments[name] = arg
+        self._arguments[name] = arg
 
         # Maintain the order of the positional arguments
         # This is used when unpacking the Namespce object returned by parse_args()
         # Strip any leading '-' as this is how they are stored in the Namespace object
         if arg.positional:
-            self.positional_args.append(arg.name.lstrip('-'))
+            self.positional_args.append(name.lstrip('-'))
         else:
-            self.optional_args.append(arg.name.lstrip('-'))
-
-    def add_arguments(self, args: Iterable[Argument]) -> None:
-        for arg in args:
-            self.add_argument(arg)
+            self.optional_args.append(name.lstrip('-'))
+        return True
 
     def has_argument(self, arg: Argument) -> bool:
-        return arg.name in self.arguments
+        return arg.name in self._arguments
 
     @property
     def add_help(self) -> bool:
@@ -336,10 +406,8 @@ class ParserNode:
     def add_help(self, value: bool) -> None:
         old_addhelp = self._add_help
         self._add_help = value
-        if value != old_addhelp and self._parser:
-            # if the value has changed and the parser has already been generated
-            # regenerate the whole parser
-            self.root.generate_parser(None)
+        if value != old_addhelp:
+            self.invalidate_parser()
 
     def generate_parser(self, parentparser) -> None:
         """
@@ -367,14 +435,14 @@ class ParserNode:
                                                    add_help=self.add_help)
 
         # Add arguments
-        if self.arguments:
-            for entry in self.arguments.values():
+        if self._arguments:
+            for entry in self._arguments.values():
                 args, kwargs = entry.get_command_line()
                 self._parser.add_argument(*args, **kwargs)
 
         # Add callback
         if self._func:
-            self._parser.set_defaults(func=self._func, node=self)
+            self._parser.set_defaults(func=self._func_memo or self._func, node=self)
 
         if self._children:
             self._subparser = self._parser.add_subparsers()
@@ -392,23 +460,27 @@ class ParserNode:
         :param command: single command name or list of hierachical names.
         """
 
-        names: List[str] = [command] if isinstance(command, str) else command.copy()
-
-        if not names:
-            # empty or None: this is the node the caller was looking for
-            return self
-
-        name = names.pop(0)
-        # check if there is a child with this name already
-        node = self._children.get(name)
-        if not node:
-            # node does not exist. Create it
-            node = ParserNode(name, self)
-            node.add_help = self.add_help
-            self._children[name] = node
-            self.root._parser = None  # invalidate any previously created ArgumentParsers
-
-        return node.get_node(names)
+        names: Iterable[str] = (command,) if isinstance(command, str) else command or ()
+
+        node = self
+        for name in names:
+            # check if there is a child with this name already
+            child = node._children.get(name)
+            if child is None:
+                # node does not exist. Create it
+                child = ParserNode(name, node)
+                child.add_help = node.add_help
+                node._children[name] = child
+                node.invalidate_parser()
+                # the command dicts of this node and all of its parents now miss the new node
+                parent = node
+                while parent:
+                    parent._command_dict = None
+                    parent = parent._parent
+            node = child
+
+        # empty or None: this is the node the caller was looking for
+        return node
 
     def has_node(self, command: Union[str, List[str]]) -> bool:
         """
@@ -419,22 +491,20 @@ class ParserNode:
         :param command: single command name or list of command names (for subcommands)
         :return: :code:`True` if node exists
         """
-        names: List[str] = [command] if isinstance(command, str) else command.copy()
+        names: List[str] = [command] if isinstance(command, str) else list(command)
         if not names:  # empty list
             return False
 
-        if names[0] == self._title:  # name match,
-            if len(names) == 1:  # no further subcommand names
-                return True
-            else:
-                names.pop(0)  # remove this name and continue with the children
+        if names[0] == self._title:  # name match, continue with the children
+            del names[0]
 
-        # check if there is a child with this name exists
-        node = self._children.get(names[0])
-        if node:
-            return node.has_node(names)
-        else:
-            return False
+        # walk down the tree, without creating any missing nodes
+        node = self
+        for name in names:
+            node = node._children.get(name)
+            if node is None:
+                return False
+        return True
 
     def get_command_dict(self) -> Dict[str, Optional[Dict]]:
         """
@@ -446,36 +516,41 @@ class ParserNode:
         <https://python-prompt-toolkit.readthedocs.io/en/master/pages/asking_for_input.html#nested-completion>`_
         for details.
 
+        The dictionary is cached until a new command is added. It must not be modified.
+
         :returns: dict
         """
+        if self._command_dict is not None:
+            return self._command_dict
 
         sub_dicts = {}
         for child in self._children.values():
             sub_dicts.update(child.get_command_dict())
 
         if self.title is None:  # root node has only sub-commands but is not a command itself
-            return sub_dicts
-
-        if sub_dicts:
+            self._command_dict = sub_dicts
+        elif sub_dicts:
             # at least one sub command
-            return {self.title: sub_dicts}
+            self._command_dict = {self.title: sub_dicts}
         else:
-            return {self.title: None}
+            self._command_dict = {self.title: None}
+        return self._command_dict
 
-    def no_command(self, **_) -> None:
-        # do nothing
+    @staticmethod
+    def no_command(**_) -> None:
+        # do nothing. Static, so all nodes share one function object and no node references itself.
         pass
 
     def analyse_signature(self, func: Callable):
-        signature = inspect.signature(func)
+        signature = get_signature(func)
         parameters: Mapping[str, inspect.Parameter] = signature.parameters
         for name, para in parameters.items():
             # ignore *args and **kwargs
-            if str(para).startswith("*args") or str(para).startswith("**kwargs"):
+            if para.kind in VARIADIC_KINDS:
                 continue
 
             # if first parameter is self this is a bound method
-            if str(para) == "self":
+            if name == "self" and para.annotation is signature.empty and para.default is signature.empty:
                 self._func_has_self = True
                 continue
 
@@ -489,26 +564,26 @@ class ParserNode:
                 arg: Argument = Argument(name, self.function_globals)
 
             if not self._ignore_annotations:
-                p = parameters[name]
-
                 # check if annotation or default are empty (check against 'signature.empty')
-                annotation = p.annotation if p.annotation != signature.empty else ""
-                default = p.default if p.default != signature.empty else None
+                annotation = para.annotation
+                default = para.default if para.default is not signature.empty else None
 
-                # now analyse the complete annotation.
-                self.analyse_annotation(annotation, arg)
+                # now analyse the complete annotation (if there is one).
+                if annotation is not signature.empty and annotation != "":
+                    self.analyse_annotation(annotation, arg)
 
                 # handle some special cases
-                if arg.optional and default is False:
+                implied_bool = arg.optional and arg.action not in BOOLEAN_OPTIONAL_ACTIONS
+                if implied_bool and default is False:
                     # This seems counter-intuitive, but if a flag is absent on the command line
                     # nothing is returned from the parse_arg() call and the default of 'False'
                     # is assigned to the argument.
-                    arg.action = "store_true"  # -f: Flag = False
+                    arg.action = ACTION_STORE_TRUE  # -f: Flag = False
                     arg.type = None  # store_true implies bool
-                if arg.optional and default is True:
-                    arg.action = "store_false"  # -f: Flag = True
+                if implied_bool and default is True:
+                    arg.action = ACTION_STORE_FALSE  # -f: Flag = True
                     arg.type = None  # store_true implies bool
-                if arg.action == "store_const" or arg.action == "append_const":
+                if arg.action in CONST_ACTIONS:
                     arg.const = default  # -f: Flag | AppendConst = 42
                 else:
                     arg.default = default
@@ -528,216 +603,131 @@ class ParserNode:
         # At this point the annotation can be either
         #  -    a string (Python 3.10+ or Python 3.7+ with from __future__ import annotations), or
         #  -    a Type or Class (Python 3.5 - Python 3.9)
-        # convert everything non-stringy into a string for further parsing
-        if inspect.isclass(annotation):
+        if isinstance(annotation, str):
+            a_str = annotation
+        elif is_typed_annotation_class(annotation):
+            # e.g. OneOrMore[int]: use the type directly instead of evaluating its name
+            for argtype in get_args(annotation):
+                arg.type = argtype
+            self.apply_annotation_steps(ANNOTATION_CLASS_STEPS[get_origin(annotation)][1], arg)
+            return
+        elif inspect.isclass(annotation) and get_origin(annotation) is None:
+            # Plain classes can be handled directly without converting them to a string and back.
+            # (Python 3.9 and 3.10 also report generic aliases like OneOrMore[int] as classes, hence the origin check)
+            if annotation in ANNOTATION_CLASS_STEPS:
+                self.apply_annotation_steps(ANNOTATION_CLASS_STEPS[annotation][1], arg)
+                return
+            if annotation not in ANNOTATION_EXPRESSION_CLASSES:
+                if annotation is not Any:  # Any does not imply anything so ignore it.
+                    arg.type = annotation
+                return
             a_str = fullname(annotation)
+        elif get_origin(annotation) in UNION_TYPES and NoneType not in get_args(annotation):
+            # Union[...] or X | Y: analyse each member on its own so that classes take the fast path above.
+            for member in get_args(annotation):
+                self.analyse_annotation(member, arg)
+            return
         else:
+            # convert everything non-stringy into a string for further parsing
             a_str = str(annotation)
 
         # from here we only deal with string annotation, regardless of the Python version
         # This makes it compatible with versions older than 3.8 (which has methods for
         # analyzing types)
+        # The same annotations are used over and over again, so the analysis of the string is cached.
+        self.apply_annotation_steps(annotation_steps(a_str), arg)
 
-        # check if 3.10 style Union (seperated by bars) or pre 3.10 (Union[...])
-        old_style_parser = re.compile(r".*Union\[(.*)]")  # parse "Union[foo, bar]" to "foo, bar"
-        m = old_style_parser.match(a_str)
-        if m:
-            # Union[...] used
-            union_group = m.group(1)
-            # now split by comma, but not bracketed commas
-            annotation_parts = split_union(union_group)
-        else:
-            # bar separation (or just a single type)
-            annotation_parts = a_str.split('|')
+    def analyse_annotation_part(self, part: str, arg: Argument) -> None:
+        self.apply_annotation_steps(annotation_part_steps(part), arg)
 
-        if annotation_parts:
-            # at least one part present
-            # now parse each part of the union annotation (or the single part if not a union)
-            for part in annotation_parts:
-                part = part.strip()
-                if part:  # could be empty
-                    self.analyse_annotation_part(part, arg)
+    def apply_annotation_steps(self, steps: Iterable[Tuple[str, Any]], arg: Argument) -> None:
+        """
+        Apply the steps generated by :func:`annotation_steps` to an Argument.
 
-    def analyse_annotation_part(self, part: str, arg: Argument) -> None:
-        if is_type_key(Flag, part):
-            check_explicit_type(part, arg)
-            arg.name = '-' + arg.name
-        elif is_type_key(RequiredFlag, part):
-            check_explicit_type(part, arg)
-            arg.name = '-' + arg.name
-            arg.required = True
-
-        elif is_type_key(Option, part):
-            check_explicit_type(part, arg)
-            arg.name = '--' + arg.name
-        elif is_type_key(RequiredOption, part):
-            check_explicit_type(part, arg)
-            arg.name = '--' + arg.name
-            arg.required = True
-
-        elif is_type_key(OneOrMore, part):
-            check_explicit_type(part, arg)
-            arg.nargs = "+"
-
-        elif is_type_key(ZeroOrMore, part):
-            check_explicit_type(part, arg)
-            arg.nargs = "*"
-
-        elif is_type_key(ZeroOrOne, part):
-            check_explicit_type(part, arg)
-            arg.nargs = "?"
-
-        elif is_type_key(Exactly1, part):
-            check_explicit_type(part, arg)
-            arg.nargs = 1
-        elif is_type_key(Exactly2, part):
-            check_explicit_type(part, arg)
-            arg.nargs = 2
-        elif is_type_key(Exactly3, part):
-            check_explicit_type(part, arg)
-            arg.nargs = 3
-        elif is_type_key(Exactly4, part):
-            check_explicit_type(part, arg)
-            arg.nargs = 4
-        elif is_type_key(Exactly5, part):
-            check_explicit_type(part, arg)
-            arg.nargs = 5
-        elif is_type_key(Exactly6, part):
-            check_explicit_type(part, arg)
-            arg.nargs = 6
-        elif is_type_key(Exactly7, part):
-            check_explicit_type(part, arg)
-            arg.nargs = 7
-        elif is_type_key(Exactly8, part):
-            check_explicit_type(part, arg)
-            arg.nargs = 8
-        elif is_type_key(Exactly9, part):
-            check_explicit_type(part, arg)
-            arg.nargs = 9
-
-        elif is_type_key(Choices, part):
-            expression = get_bracket_content(part)
-            expression = resolve_literals(expression)
-            choices = eval(expression, self.function_globals)
-            arg.choices = choices
+        Any expressions in the steps are evaluated with the globals of the command function.
 
-        elif is_type_key(StoreAction, part):
-            arg.action = "store"
-
-        elif is_type_key(StoreConstAction, part):
-            arg.action = "store_const"
-
-        elif is_type_key(StoreTrueAction, part):
-            arg.action = "store_true"
-
-        elif is_type_key(StoreFalseAction, part):
-            arg.action = "store_false"
-
-        elif is_type_key(AppendAction, part):
-            arg.action = "append"
-
-        # AppendConstAction is not supported by ArgParseDecorator
-        # elif is_type_key(AppendConstAction, part):
-        #     arg.action = "append_const"
-
-        elif is_type_key(CountAction, part):
-            arg.action = "count"
-            if arg.type == int:
-                # the count action implies an int type and does not like explicit type declarations
-                arg.type = None
-            elif arg.type:
-                # raise an exception if any type other than int has been set
-                raise TypeError("'Count' implies type int and does not accept any other type.")
-
-        elif is_type_key(ExtendAction, part):
-            arg.action = "extend"
-
-        elif is_type_key(CustomAction, part):
-            expression = get_bracket_content(part)
-            expression = resolve_literals(expression)
-            if not expression:
-                raise ValueError(f"CustomAction requires a parameter, CustomAction[...]")
-            actionclass = eval(expression, self.function_globals)
-            if not callable(actionclass):
-                raise ValueError(
-                    f"CustomAction requires a callable as parameter, was {str(actionclass)}")
-            arg.action = actionclass
-
-        # None of the predefined keywords matches, therefore it is propably a type
-        else:
-            if part:
-                if part != "typing.Any":  # Any does not imply anything so ignore it.
-                    # convert string of type back to type
-                    arg.type = eval(part, self.function_globals)
+        :param steps: The steps from :func:`annotation_steps` or :func:`annotation_part_steps`
+        :param arg: The Argument to modify
+        """
+        # This loop runs once per decorated command and most of its time is spent in the Argument
+        # property setters, so neither a JIT (Numba does not handle str or arbitrary objects) nor a
+        # C implementation of the dispatch would gain anything measurable.
+        for kind, value in steps:
+            if kind == STEP_PREFIX:
+                arg.name = value + arg.name
+
+            elif kind == STEP_CHOICES:
+                arg.choices = evaluate_choices(value, self.function_globals)
+
+            elif kind == STEP_COUNT:
+                arg.action = ACTION_COUNT
+                if arg.type == int:
+                    # the count action implies an int type and does not like explicit type declarations
+                    arg.type = None
+                elif arg.type:
+                    # raise an exception if any type other than int has been set
+                    raise TypeError("'Count' implies type int and does not accept any other type.")
+
+            elif kind == STEP_CUSTOM_ACTION:
+                actionclass = eval(value, self.function_globals)
+                if not callable(actionclass):
+                    raise ValueError(
+                        f"CustomAction requires a callable as parameter, was {str(actionclass)}")
+                arg.action = actionclass
+
+            elif kind == STEP_EVAL_TYPE:
+                # convert string of type back to type
+                arg.type = eval(value, self.function_globals)
 
-        return
+            else:
+                # all other steps just set an Argument property
+                setattr(arg, kind, value)
 
     def analyse_docstring(self, func: Callable) -> None:
         """
         Parse the docstring to extract the description (anything before the first metadata) and any metadata.
         """
 
-        description: List[str] = []
         docstring = func.__doc__
         if not docstring:
             # nothing to do if there is no docstring.
             return
-        lines = docstring.splitlines()
 
-        in_description = True
+        # The docstring of a function is a constant of its code object, so the same docstring
+        # is analysed over and over again if a command is decorated more than once.
+        description, directives = docstring_directives(docstring)
 
-        for line in lines:
-            line = line.strip()
-            if line.startswith(':param'):
-                # :param name: help text
-                in_description = False
-                self.parse_param(line[len(':param'):].strip())
+        handlers = {
+            ':param': self.parse_param,  # :param name: help text
+            ':alias': self.parse_alias,  # :alias name: alias1, alias2, ...
+            ':choices': self.parse_choices,  # :choices name: choice1, choice2, ...
+            ':metavar': self.parse_metavar,  # :metavar name: meta1, meta2, ...
+        }
+        for directive, content in directives:
+            handlers[directive](content)
 
-            elif line.startswith(':alias'):
-                # :alias name: alias1, alias2, ...
-                in_description = False
-                self.parse_alias(line[len(':alias'):].strip())
-
-            elif line.startswith(":choices"):
-                in_description = False
-                self.parse_choices(line[len(':choices'):].strip())
-
-            elif line.startswith(":metavar"):
-                in_description = False
-                self.parse_metavar(line[len(':metavar'):].strip())
-
-            elif in_description and line:
-                description.append(line)
-            else:
-                # ignore anything else
-                pass
-
-        self.description = ' '.join(description)
+        self.description = description
         return
 
     def parse_param(self, line: str) -> None:
         # split into name and description
-        tmp = line.split(':', maxsplit=1)
-        arg_name = tmp[0].strip()
+        arg_name, _, arg_help = line.partition(':')  # no ':' leaves an empty help
+        arg_name = arg_name.strip()
         arg = self.get_argument(arg_name)
         if not arg:
             # The parameter does not exist
             raise NameError(f":param {arg_name}: No parameter with the name {arg_name}")
-        if len(tmp) > 1:
-            arg_help = tmp[1].strip()
-            if arg_help.startswith("SUPPRESS"):
-                arg_help = argparse.SUPPRESS
-        else:
-            arg_help = ""
+        arg_help = arg_help.strip()
+        if arg_help.startswith("SUPPRESS"):
+            arg_help = argparse.SUPPRESS
         arg.help = arg_help
 
     def parse_alias(self, line: str) -> None:
         # split into name and list of aliases
-        tmp = line.split(':', maxsplit=1)
-        arg_name = tmp[0].strip()
-        if len(tmp) > 1:
-            arg_aliases = tmp[1].split(',')
-            arg_aliases = [s.strip() for s in arg_aliases]
+        arg_name, sep, aliases = line.partition(':')
+        arg_name = arg_name.strip()
+        if sep:
+            arg_aliases = [s.strip() for s in aliases.split(',')]
         else:
             raise ValueError(":alias: directive requires at least one alias.")
 
@@ -752,15 +742,15 @@ class ParserNode:
 
     def parse_choices(self, line: str) -> None:
         # split into name and the coices
-        tmp = line.split(':', maxsplit=1)
-        arg_name = tmp.pop(0).strip()
-        if not tmp or not tmp[0]:
+        arg_name, _, expression = line.partition(':')
+        arg_name = arg_name.strip()
+        if not expression:
             raise ValueError(":choices ...: must have some actual choices.")
         arg = self.get_argument(arg_name)
         if not arg:
             raise NameError(f":choices {arg_name}: Can't find an argument names {arg_name}")
 
-        choices = eval(tmp[0], self.function_globals)
+        choices = evaluate_choices(expression, self.function_globals)
         # choices must be iterable. Check this
         try:
             _ = iter(choices)
@@ -769,30 +759,267 @@ class ParserNode:
             raise ValueError(f"Value of :choices {arg_name}: is not a sequence.")
 
     def parse_metavar(self, line: str) -> None:
-        # split into name and the coices
-        tmp = line.split(':', maxsplit=1)
-        arg_name = tmp.pop(0).strip()
-        if not tmp or not tmp[0]:
+        # split into name and the metavars
+        arg_name, _, metavars = line.partition(':')
+        arg_name = arg_name.strip()
+        if not metavars:
             raise ValueError(":metavar ...: requires at least one metavar name.")
         arg = self.get_argument(arg_name)
         if not arg:
             raise NameError(f":metavar {arg_name}: Can't find an argument named {arg_name}")
 
-        metas = split_strip(tmp[0])
-        metas = [m.strip('"\'') for m in metas]
-        arg.metavar = metas
+        # split, remove whitespace and quotes in a single pass
+        arg.metavar = tuple(m.strip().strip('"\'') for m in metavars.split(','))
 
     def __str__(self, level: int = 0):
-        args = ','.join([str(arg) for arg in self.arguments])
-        result = f"{self.title}({args}) : {self.description}"
-        if self._children:
-            for name in self._children.keys():
-                childstr = str(self._children[name])
-                # indent by one tab
-                chlstrlist = [f"\t{val}" for val in childstr.splitlines()]
-                childstr = "\n".join(chlstrlist)
-                result = f"{result}\n{childstr}"
-        return result
+        # walk the tree depth-first with an explicit stack and indent each node by one tab per level.
+        lines: List[str] = []
+        stack = [(self, 0)]
+        while stack:
+            node, depth = stack.pop()
+            args = ','.join(node._arguments)
+            nodestr = f"{node.title}({args}) : {node.description}"
+            if depth:
+                lines.extend("\t" * depth + line for line in nodestr.splitlines())
+            else:
+                lines.append(nodestr)
+            stack.extend((child, depth + 1) for child in reversed(node._children.values()))
+        return "\n".join(lines)
+
+
+SIGNATURE_CACHE: MutableMapping[Callable, inspect.Signature] = weakref.WeakKeyDictionary()
+"""Cache for :func:`get_signature`. Entries are removed automatically when the function is deleted."""
+
+
+DOCSTRING_DIRECTIVES = frozenset((':param', ':alias', ':choices', ':metavar'))
+"""The docstring directives used by :meth:`ParserNode.analyse_docstring`."""
+
+
+@functools.lru_cache(maxsize=1024)
+def docstring_directives(docstring: str) -> Tuple[str, Tuple[Tuple[str, str], ...]]:
+    """
+    Split a docstring into the description and the directives.
+
+    The description is anything before the first directive, joined into a single line.
+    The docstring is scanned once, line by line, and only lines starting with a ':' are
+    checked for a directive.
+
+    :param docstring: the docstring of a command function
+    :return: the description and a tuple with the directive and the rest of the line
+        for every directive, e.g. :code:`(':param', 'foo: help for foo')`
+    """
+    description: List[str] = []
+    directives: List[Tuple[str, str]] = []
+    in_description = True
+
+    for line in map(str.strip, docstring.splitlines()):
+        if line.startswith(':'):
+            directive, *content = line.split(maxsplit=1)
+            if directive in DOCSTRING_DIRECTIVES:
+                in_description = False
+                directives.append((directive, content[0] if content else ""))
+                continue
+        if in_description and line:
+            description.append(line)
+        # ignore anything else
+
+    return ' '.join(description), tuple(directives)
+
+
+def get_signature(func: Callable) -> inspect.Signature:
+    """
+    Get the :external:class:`inspect.Signature` of a function.
+
+    The signature of a function does not change, so it is only generated
+    once for each function and then cached.
+
+    :param func: any callable
+    :return: the signature of the callable
+    """
+    try:
+        return SIGNATURE_CACHE[func]
+    except KeyError:
+        signature = inspect.signature(func)
+        SIGNATURE_CACHE[func] = signature
+        return signature
+    except TypeError:
+        # not hashable or can't be weakly referenced, e.g. some builtins
+        return inspect.signature(func)
+
+
+def memoized(func: Callable[..., Any], maxsize: Optional[int]) -> Callable[..., Any]:
+    """
+    Wrap a function with a :func:`functools.lru_cache`.
+
+    Unlike the plain :code:`lru_cache` the wrapper falls back to calling the function directly
+    if any argument is not hashable.
+
+    :param func: The function to wrap
+    :param maxsize: The maximum number of cached results, :code:`None` for no limit.
+    :return: The wrapper function. It has the :code:`cache_clear()` method of the cache.
+    """
+    cached = functools.lru_cache(maxsize=maxsize)(func)
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        try:
+            hash((args, tuple(kwargs.items())))
+        except TypeError:
+            return func(*args, **kwargs)
+        return cached(*args, **kwargs)
+
+    wrapper.cache_clear = cached.cache_clear
+    return wrapper
+
+
+NoneType = type(None)
+
+UNION_TYPES = frozenset((Union, getattr(types, "UnionType", Union)))
+"""The origins of :code:`Union[X, Y]` and, for Python 3.10+, :code:`X | Y` annotations."""
+
+VARIADIC_KINDS = frozenset((inspect.Parameter.VAR_POSITIONAL, inspect.Parameter.VAR_KEYWORD))
+"""The kinds of :code:`*args` and :code:`**kwargs` parameters, which do not become Arguments."""
+
+STEP_PREFIX = "prefix"
+"""Annotation step: prepend the value (:code:`-` or :code:`--`) to the Argument name."""
+STEP_CHOICES = "choices_expression"
+"""Annotation step: evaluate the value and set it as the Argument choices."""
+STEP_COUNT = "count"
+"""Annotation step: set the count action and remove any explicit int type."""
+STEP_CUSTOM_ACTION = "custom_action"
+"""Annotation step: evaluate the value and set it as the Argument action."""
+STEP_EVAL_TYPE = "eval_type"
+"""Annotation step: evaluate the value and set it as the Argument type."""
+
+
+@functools.lru_cache(maxsize=1024)
+def annotation_steps(annotation: str) -> Tuple[Tuple[str, Any], ...]:
+    """
+    Analyse an annotation string and return the steps required to apply it to an Argument.
+
+    Each step is a tuple of the kind of step and a value. The kind is either one of the
+    :code:`STEP_...` constants or the name of an Argument property that is set to the value.
+
+    The result only depends on the annotation string. Anything that needs to be evaluated, like
+    types or choices, is kept as an expression string and evaluated later by
+    :meth:`ParserNode.apply_annotation_steps`. This makes the result cachable.
+
+    :param annotation: A complete annotation, e.g. :code:`"Union[int, OneOrMore]"`
+    :return: tuple of steps
+    """
+    # check if 3.10 style Union (seperated by bars) or pre 3.10 (Union[...])
+    m = UNION_PARSER.match(annotation)
+    if m:
+        # Union[...] used
+        union_group = m.group(1)
+        # now split by comma, but not bracketed commas
+        annotation_parts = split_union(union_group)
+    else:
+        # bar separation (or just a single type)
+        annotation_parts = split_top_level(annotation, '|')
+
+    steps: List[Tuple[str, Any]] = []
+    # now parse each part of the union annotation (or the single part if not a union)
+    for part in annotation_parts:
+        if part:  # could be empty
+            steps.extend(annotation_part_steps(part))
+    return tuple(steps)
+
+
+@functools.lru_cache(maxsize=1024)
+def annotation_part_steps(part: str) -> Tuple[Tuple[str, Any], ...]:
+    """
+    Analyse a single part of an annotation, e.g. :code:`"OneOrMore[int]"`.
+
+    See :func:`annotation_steps` for details.
+
+    :param part: single annotation
+    :return: tuple of steps
+    """
+    m = ANNOTATION_PART_PARSER.match(part)
+    if m:
+        name = m.lastgroup
+        if name in ANNOTATION_PART_HANDLERS:
+            # annotation with an expression, e.g. Choices[...]
+            return ANNOTATION_PART_HANDLERS[name](part)
+
+        accepts_type, steps = ANNOTATION_STEPS[name]
+        if accepts_type:
+            return explicit_type_steps(part) + steps
+        return steps
+
+    # None of the predefined keywords matches, therefore it is propably a type
+    if part and part != "typing.Any":  # Any does not imply anything so ignore it.
+        return (STEP_EVAL_TYPE, part),
+
+    return ()
+
+
+def custom_action_steps(part: str) -> Tuple[Tuple[str, Any], ...]:
+    expression = get_bracket_content(part)
+    expression = resolve_literals(expression)
+    if not expression:
+        raise ValueError(f"CustomAction requires a parameter, CustomAction[...]")
+    return (STEP_CUSTOM_ACTION, expression),
+
+
+def choices_steps(part: str) -> Tuple[Tuple[str, Any], ...]:
+    expression = get_bracket_content(part)
+    expression = resolve_literals(expression)
+    return (STEP_CHOICES, expression),
+
+
+ANNOTATION_CLASS_STEPS: Dict[type, Tuple[bool, Tuple[Tuple[str, Any], ...]]] = {
+    Flag: (True, ((STEP_PREFIX, '-'),)),
+    RequiredFlag: (True, ((STEP_PREFIX, '-'), ("required", True))),
+    Option: (True, ((STEP_PREFIX, '--'),)),
+    RequiredOption: (True, ((STEP_PREFIX, '--'), ("required", True))),
+    OneOrMore: (True, (("nargs", NARGS_ONE_OR_MORE),)),
+    ZeroOrMore: (True, (("nargs", NARGS_ZERO_OR_MORE),)),
+    ZeroOrOne: (True, (("nargs", NARGS_ZERO_OR_ONE),)),
+    StoreAction: (False, (("action", ACTION_STORE),)),
+    StoreConstAction: (False, (("action", ACTION_STORE_CONST),)),
+    StoreTrueAction: (False, (("action", ACTION_STORE_TRUE),)),
+    StoreFalseAction: (False, (("action", ACTION_STORE_FALSE),)),
+    AppendAction: (False, (("action", ACTION_APPEND),)),
+    # AppendConstAction is not supported by ArgParseDecorator
+    CountAction: (False, ((STEP_COUNT, None),)),
+    ExtendAction: (False, (("action", ACTION_EXTEND),)),
+}
+"""
+The steps for all annotation classes without an expression.
+The first item is :code:`True` if the annotation accepts an explicit type, e.g. :code:`OneOrMore[int]`.
+"""
+
+ANNOTATION_CLASS_STEPS.update({cls: (True, (("nargs", number),))
+                               for number, cls in enumerate((Exactly1, Exactly2, Exactly3, Exactly4, Exactly5,
+                                                             Exactly6, Exactly7, Exactly8, Exactly9), start=1)})
+
+ANNOTATION_STEPS: Dict[str, Tuple[bool, Tuple[Tuple[str, Any], ...]]] = {
+    cls.__name__: steps for cls, steps in ANNOTATION_CLASS_STEPS.items()}
+"""Same as :data:`ANNOTATION_CLASS_STEPS`, but by class name."""
+
+ANNOTATION_EXPRESSION_CLASSES = frozenset((Choices, CustomAction))
+"""Annotation classes that require an expression, e.g. :code:`Choices[...]`."""
+
+ANNOTATION_PART_HANDLERS: Dict[str, Callable[[str], Tuple[Tuple[str, Any], ...]]] = {
+    Choices.__name__: choices_steps,
+    CustomAction.__name__: custom_action_steps,
+}
+"""The handlers generating the steps for annotation classes with an expression, by class name."""
+
+ANNOTATION_PART_PARSER = re.compile(
+    r"(?:{module}\.)?(?:{names})(?=\[|$)".format(
+        module=re.escape(Flag.__module__),
+        names="|".join(f"(?P<{name}>{name})" for name in [*ANNOTATION_STEPS, *ANNOTATION_PART_HANDLERS])))
+"""
+Matches the name of an annotation class, either plain (:code:`Flag`) or fully qualified
+(:code:`argparsedecorator.annotations.Flag`), with an optional :code:`[...]`.
+The name of the matching group is the name of the annotation class.
+"""
+
+UNION_PARSER = re.compile(r".*Union\[(.*)]")
+"""Parse "Union[foo, bar]" to "foo, bar"."""
 
 
 def split_strip(string: str, sep: str = ',') -> List[str]:
@@ -801,8 +1028,10 @@ def split_strip(string: str, sep: str = ',') -> List[str]:
     return [s.strip() for s in splitted]
 
 
+@functools.lru_cache(maxsize=512)
 def resolve_literals(string: str) -> str:
     # replace Literal[...] with a tuple (...)
+    # The result only depends on the string, so it is cached (including the recursive calls for nested Literals)
     matches = ("typing.Literal[", "Literal[")
     start = exp_start = -1
     for match in matches:
@@ -836,16 +1065,6 @@ def resolve_literals(string: str) -> str:
     return resolve_literals(resolved)  # recursive call in case there are more embedded Literals
 
 
-def is_type_key(targettype: Type, part: str) -> bool:
-    part = part.split('[')[0]  # if the type has an optional [...] discard it
-    if part == targettype.__name__:
-        return True
-    elif part == fullname(targettype):
-        return True
-    else:
-        return False
-
-
 def fullname(o):
     module = o.__module__
     if module == 'builtins':
@@ -853,10 +1072,25 @@ def fullname(o):
     return module + '.' + o.__qualname__
 
 
-def check_explicit_type(part: str, arg: Argument):
+def is_typed_annotation_class(annotation: Any) -> bool:
+    """
+    Check if an annotation is one of the annotation classes with an explicit type,
+    and the explicit type is a class, e.g. :code:`OneOrMore[int]`.
+
+    :param annotation: any annotation object
+    :return: :code:`True` if the explicit type can be used directly.
+    """
+    origin = get_origin(annotation)
+    if origin not in ANNOTATION_CLASS_STEPS or not ANNOTATION_CLASS_STEPS[origin][0]:
+        return False
+    return all(inspect.isclass(argtype) and argtype is not Any for argtype in get_args(annotation))
+
+
+def explicit_type_steps(part: str) -> Tuple[Tuple[str, Any], ...]:
     part_type = get_bracket_content(part)
     if part_type:
-        arg.type = part_type
+        return ("type", part_type),
+    return ()
 
 
 def get_bracket_content(string: str) -> str:
@@ -876,23 +1110,43 @@ def get_bracket_content(string: str) -> str:
 
 
 def split_union(string: str) -> List[str]:
+    return split_top_level(string, ',')
+
+
+SEPARATOR_SCANNERS: Dict[str, re.Pattern] = {sep: re.compile(r"[" + re.escape(sep) + r"\[\](){}]") for sep in ",|"}
+"""Regular expressions matching a separator or a bracket, by separator."""
+
+
+def split_top_level(string: str, separator: str) -> List[str]:
+    """
+    Split a string at all separators that are not enclosed in brackets.
+
+    :code:`"int | Choices[Literal['a'|'b']]"` is split into :code:`["int", "Choices[Literal['a'|'b']]"]`.
+    The parts are stripped of any surrounding whitespace.
+
+    :param string: The string to split.
+    :param separator: Either :code:`','` or :code:`'|'`
+    :return: list of parts
+    """
     result: List[str] = []
-    tmp: List[str] = []
-    bracket_count = 0
-    for char in string:
-        if char == "," and bracket_count == 0:
-            result.append("".join(tmp).strip())
-            tmp = []
+    start = 0
+    depth = 0
+    # only the separators and brackets need to be looked at, let the regex engine skip everything else.
+    for m in SEPARATOR_SCANNERS[separator].finditer(string):
+        char = m.group()
+        if char == separator:
+            if depth == 0:
+                result.append(string[start:m.start()].strip())
+                start = m.end()
+        elif char in "[({":
+            depth += 1
         else:
-            tmp.append(char)
-            if char == "[" or char == "(" or char == "{":
-                bracket_count += 1
-            if char == "]" or char == ")" or char == "}":
-                bracket_count -= 1
+            depth -= 1
 
-    result.append("".join(tmp).strip())
+    result.append(string[start:].strip())
     return result
 
+
 # unused. Dirty hack used during development.
 # Kept here in case I need it some other time.
 # def get_caller_globals():
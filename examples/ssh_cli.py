@@ -41,23 +41,35 @@
     *   :func:`print_error`, :func:`print_warn` and :func:`print_info` for color coded status messages.
         The colors used can be changes by modifying the supplied :data:`style` dictionary.
 
+    *   :func:`parse_html` to convert (and cache) HTML formatted text, e.g. for prompts.
+
+    *   :func:`print_styled` to print plain text (without HTML parsing) in one of the :data:`style` classes.
+
 
 """
 
 from __future__ import annotations
 
 import asyncio
+import math
 import os
 import sys
 import time
 from asyncio import Event
-from typing import TextIO, Optional, Any, Dict, Union
+from contextlib import nullcontext
+from functools import lru_cache
+from pathlib import Path
+from typing import TextIO, Optional, Any, Dict, Union, List, Tuple
 
 import asyncssh
 from prompt_toolkit import print_formatted_text, PromptSession, HTML
 from prompt_toolkit.completion import NestedCompleter, Completer
+from prompt_toolkit.application import get_app_session
+from prompt_toolkit.formatted_text import FormattedText
+from prompt_toolkit.history import InMemoryHistory
 from prompt_toolkit.contrib.ssh import PromptToolkitSSHServer, PromptToolkitSSHSession
 from prompt_toolkit.patch_stdout import patch_stdout
+from prompt_toolkit.renderer import CPR_Support
 from prompt_toolkit.shortcuts import yes_no_dialog, ProgressBar
 from prompt_toolkit.styles import Style
 
@@ -80,6 +92,20 @@ Useful for the :func:`print_html` function.
 """
 
 
+@lru_cache(maxsize=128)
+def parse_html(text: str) -> HTML:
+    """
+    Convert a string with HTML tags to a prompt toolkit :code:`HTML` object.
+
+    The results are cached, so that fixed texts like the prompt, the intro or
+    status messages are only parsed once.
+
+    :param text: A string that may have html tags.
+    :return: The parsed HTML object
+    """
+    return HTML(text)
+
+
 def print_html(text: str) -> None:
     """
     Format and print text containing HTML tags.
@@ -91,45 +117,54 @@ def print_html(text: str) -> None:
 
     :param text: A string that may have html tags.
     """
-    print_formatted_text(HTML(text), style=style)
+    print_formatted_text(parse_html(text), style=style)
+
+
+def print_styled(style_class: str, text: str) -> None:
+    """
+    Print plain text in one of the :data:`style` classes.
+
+    Unlike :func:`print_html` the text is not parsed for HTML tags. This is faster and safe for
+    text that may contain :code:`<` or :code:`&` characters, e.g. error messages from the parser.
+
+    :param style_class: Name of the style class, e.g. :code:`"error"`
+    :param text: The message to be printed.
+    """
+    print_formatted_text(FormattedText([(f"class:{style_class}", text)]), style=style)
 
 
 def print_error(text: str) -> None:
     """
     Print an error message.
 
-    By default, this message is printed in red. As the text is printed via :func:`print_html` it can include
-    HTML tags for further formatting.
+    By default, this message is printed in red. The text is printed as is via :func:`print_styled`,
+    so it may contain :code:`<` or :code:`&` characters. Use :func:`print_html` for formatted text.
 
     :param text: The message to be printed.
     """
-    print_html(f"<error>{text}</error>")
+    print_styled("error", text)
 
 
 def print_warn(text: str) -> None:
     """
-     Print a warning message.
+    Print a warning message.
 
-     By default, this message is printed in orange. As the text is printed via :func:`print_html` it can include
-     HTML tags for further formatting.
+    By default, this message is printed in orange. Like :func:`print_error` the text is not parsed for HTML tags.
 
-     :param text: The message to be printed.
-     """
-
-    print_html(f"<warn>{text}</warn>")
+    :param text: The message to be printed.
+    """
+    print_styled("warn", text)
 
 
 def print_info(text: str) -> None:
     """
-     Print an info message.
-
-     By default, this message is printed in grey. As the text is printed via :func:`print_html` it can include
-     HTML tags for further formatting.
+    Print an info message.
 
-     :param text: The message to be printed.
-     """
+    By default, this message is printed in grey. Like :func:`print_error` the text is not parsed for HTML tags.
 
-    print_html(f"<info>{text}</info>")
+    :param text: The message to be printed.
+    """
+    print_styled("info", text)
 
 
 class BaseCLI:
@@ -162,26 +197,65 @@ class BaseCLI:
     prompt = "\n<green># </green>"
     """Prompt text to display. Override as required."""
 
+    use_patch_stdout = False
+    """
+    Set to :code:`True` if commands start background tasks that print while the prompt is displayed.
+    The session is then wrapped in the prompt toolkit
+    `patch_stdout <https://python-prompt-toolkit.readthedocs.io/en/master/pages/asking_for_input.html#prompt-in-an-asyncio-application>`_
+    context, which adds some overhead to every write.
+    """
+
     cli = ArgParseDecorator()
     """The :class:`~.argparse_decorator.ArgParseDecorator` used to decorate command methods."""
 
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        # All commands of the subclass have been registered at this point.
+        # Generate the ArgumentParser, the command dict and the completer right away,
+        # so that this does not delay the first command of the first session.
+        _ = cls.cli.argumentparser
+        command_dict = cls.cli.command_dict
+        BaseCLI._command_completer = (command_dict, NestedCompleter.from_nested_dict(command_dict))
+
     def __init__(self):
-        self.prompt_session = None
+        self.prompt_session: Optional[PromptSession] = None
         self.stdout: TextIO = sys.stdout
         self.stdin: TextIO = sys.stdin
-        self.promptsession = None
         self._server: Optional[asyncssh.SSHAcceptor] = None
         self.completer: Optional[Completer] = None
+        self._session_pool: List[PromptSession] = []
 
     @property
     def command_dict(self) -> Dict[str, Optional[Dict]]:
         """
         A dictionary with all supported commands suitable for the PromptToolkit
         `Autocompleter <https://python-prompt-toolkit.readthedocs.io/en/master/pages/asking_for_input.html#autocompletion>`_
+
+        All subclasses register their commands with the one shared :attr:`cli`, so this is the
+        command dict of :attr:`cli`. It is cached by the ArgParseDecorator until a new command
+        is added and must not be modified.
         """
-        # make the command-dict accessible
         return self.cli.command_dict
 
+    _command_completer: Optional[Tuple[Dict[str, Optional[Dict]], Completer]] = None
+    """Cached command completer together with the command dict it was built from."""
+
+    @property
+    def command_completer(self) -> Completer:
+        """
+        A `NestedCompleter
+        <https://python-prompt-toolkit.readthedocs.io/en/master/pages/asking_for_input.html#nested-completion>`_
+        for all commands from :meth:`command_dict`.
+
+        The completer is shared by all instances and sessions. It is only rebuilt when
+        :attr:`cli` returns a new command dict, i.e. after a command has been added.
+        """
+        command_dict = self.command_dict
+        cached = BaseCLI._command_completer
+        if cached is None or cached[0] is not command_dict:
+            cached = BaseCLI._command_completer = (command_dict, NestedCompleter.from_nested_dict(command_dict))
+        return cached[1]
+
     @property
     def sshserver(self) -> asyncssh.SSHAcceptor:
         """
@@ -217,6 +291,9 @@ class BaseCLI:
         """
         Prints any parser error messages in the <error> style (default: red)
 
+        The message is printed as plain text, as error messages are not expected
+        to contain any HTML formatting.
+
         Override this for more elaborate error handling.
 
         :param exc: Exception containg the error message.
@@ -228,7 +305,8 @@ class BaseCLI:
         """
         Start a new prompt session.
 
-        Called from :meth:`cmdloop` for each new session.
+        Called from :meth:`cmdloop` for a new session if there is no PromptSession from a previous,
+        already closed, connection that can be reused.
 
         By default, it will return a simple PromptSession without any argument.
         Override to customize the prompt session.
@@ -237,6 +315,57 @@ class BaseCLI:
         """
         return PromptSession()
 
+    async def acquire_prompt_session(self) -> PromptSession:
+        """
+        Get a PromptSession for a new connection.
+
+        Creating a PromptSession is fairly expensive (key bindings, buffers, layout), so the sessions
+        of closed connections are kept in a pool and reused.
+        A reused session is bound to the in- and output of the current connection, its renderer state
+        (cursor position, screen size, CPR support) is reset and its history is cleared.
+
+        :return: a PromptSession for the current connection
+        """
+        if not self._session_pool:
+            return await self.get_prompt_session()
+
+        # Re-targeting a session is not part of the documented prompt_toolkit API. It relies on
+        # the prompt_toolkit 3.0 internals (checked with 3.0.52):
+        # - Application and Renderer read their input / output from the plain attributes
+        #   app.input, app.output and renderer.output on every run, they are not copied elsewhere.
+        # - Renderer.reset() clears the cursor position and screen size, but not the CPR
+        #   (cursor position request) state, which is stored in renderer.cpr_support.
+        # - The default Buffer keeps its own reference to the history and does not follow
+        #   PromptSession.history.
+        # If these change in a future prompt_toolkit version, stop pooling and always
+        # create a new session with get_prompt_session().
+        prompt_session = self._session_pool.pop()
+        app_session = get_app_session()
+        app = prompt_session.app
+        app.input = app_session.input
+        app.output = app_session.output
+
+        # forget everything the renderer has learned about the terminal of the previous connection
+        renderer = app.renderer
+        renderer.output = app_session.output
+        renderer.cpr_support = CPR_Support.UNKNOWN if app_session.output.responds_to_cpr \
+            else CPR_Support.NOT_SUPPORTED
+        renderer.reset(leave_alternate_screen=False)
+
+        # do not leak the commands of the previous connection
+        prompt_session.history = InMemoryHistory()
+        prompt_session.default_buffer.history = prompt_session.history
+        prompt_session.default_buffer.reset()
+        return prompt_session
+
+    def release_prompt_session(self, prompt_session: PromptSession) -> None:
+        """
+        Return the PromptSession of a closed connection to the pool for later reuse.
+
+        :param prompt_session: the PromptSession acquired with :meth:`acquire_prompt_session`
+        """
+        self._session_pool.append(prompt_session)
+
     # noinspection PyMethodMayBeStatic
     async def run_prompt(self, prompt_session: PromptSession) -> Any:
         """
@@ -251,12 +380,10 @@ class BaseCLI:
         # List (actually a dict) of all implemented commands is provided by the ArgparseDecorator and
         # used by the prompt_toolkit
         if not self.completer:
-            # create the command dict only once
-            all_commands = self.command_dict
-            self.completer = NestedCompleter.from_nested_dict(all_commands)
+            self.completer = self.command_completer
 
         # The prompt visual
-        prompt_formatted = HTML(self.prompt)
+        prompt_formatted = parse_html(self.prompt)
 
         return await prompt_session.prompt_async(prompt_formatted, completer=self.completer)
 
@@ -267,6 +394,9 @@ class BaseCLI:
         :return: 'exit' to close the current ssh session, 'shutdown' to end the ssh server.
                   All other values are ignored.
         """
+        # The command line is parsed on the event loop thread. Parsing a command takes only a few
+        # microseconds, less than handing it over to an executor thread. It would also be unsafe, as
+        # execute_async() redirects sys.stdout, which is shared by all threads.
         result = await self.cli.execute_async(cmdline, base=self, error_handler=self.error_handler, stdout=self.stdout)
         return result
 
@@ -283,38 +413,45 @@ class BaseCLI:
         :param ssh_session: Session object
         """
 
-        self.prompt_session = PromptSession(refresh_interval=0.5)
+        prompt_session = await self.acquire_prompt_session()
+        self.prompt_session = prompt_session
 
         # tell the CLI about stdout (if not using the print_formatted_text() function)
         self.stdout = ssh_session.app_session.output
         self.stdin = ssh_session.app_session.input
 
-        print_formatted_text(HTML(self.intro))
-
-        with patch_stdout():
-            while True:
-                try:
-                    command = await self.run_prompt(self.prompt_session)
-                    if command:
-                        result = await self.execute(command)
-                        if result == "exit":
-                            # close current connection
-                            print_warn("Closing SSH connection")
-                            return
-
-                        if result == "shutdown":
-                            if self.sshserver:
-                                print_warn("SSH Server is shutting down")
-                                self.sshserver.close()
+        print_html(self.intro)
+
+        stdout_context = patch_stdout() if self.use_patch_stdout else nullcontext()
+
+        try:
+            with stdout_context:
+                while True:
+                    try:
+                        command = await self.run_prompt(prompt_session)
+                        if command:
+                            result = await self.execute(command)
+                            if result == "exit":
+                                # close current connection
+                                print_warn("Closing SSH connection")
                                 return
-                            print_warn("Could not shut down ssh server: server not set")
 
-                except KeyboardInterrupt:
-                    print_warn("SSH connection closed by Ctrl-C")
-                    return
-                except EOFError:
-                    # Ctrl-D : ignore
-                    pass
+                            if result == "shutdown":
+                                if self.sshserver:
+                                    print_warn("SSH Server is shutting down")
+                                    self.sshserver.close()
+                                    return
+                                print_warn("Could not shut down ssh server: server not set")
+
+                    except KeyboardInterrupt:
+                        print_warn("SSH connection closed by Ctrl-C")
+                        return
+                    except EOFError:
+                        # Ctrl-D : ignore
+                        pass
+        finally:
+            # keep the prompt session for the next connection
+            self.release_prompt_session(prompt_session)
 
 
 class DemoCLI(BaseCLI):
@@ -337,7 +474,7 @@ class DemoCLI(BaseCLI):
         Sleep for some time.
         :param duration: sleep time im duration
         """
-        print_info("<info>start sleeping</info>")
+        print_info("start sleeping")
         t_start = time.time()
         await asyncio.sleep(duration)
         t_end = time.time()
@@ -349,10 +486,22 @@ class DemoCLI(BaseCLI):
         Show a progress bar.
         :param ticks: Number of ticks in the progressbar. Default is 50
         """
+        tick_time = 0.1
+        redraw_time = 0.25
+
         # Simple progress bar.
+        # Advance the bar in chunks of ticks so that the event loop wakes up and the
+        # bar is redrawn at most every redraw_time seconds (rounded up to whole ticks)
+        # instead of on every tick.
+        chunk = max(1, math.ceil(redraw_time / tick_time))
         with ProgressBar() as pb:
-            for _ in pb(range(ticks)):
-                await asyncio.sleep(0.1)
+            counter = pb(total=ticks)
+            for completed in range(0, ticks, chunk):
+                num = min(chunk, ticks - completed)
+                await asyncio.sleep(num * tick_time)
+                counter.items_completed += num
+                pb.invalidate()
+            counter.done = True
 
     @cli.command
     async def input(self) -> None:
@@ -360,7 +509,7 @@ class DemoCLI(BaseCLI):
         Ask for user input.
         Demo for running a new prompt within commands.
         """
-        value = await self.promptsession.prompt_async("Enter some random value: ")
+        value = await self.prompt_session.prompt_async("Enter some random value: ")
         print_html(f"you have entered a value of {value}")
 
 
@@ -373,11 +522,22 @@ class SshCLIServer:
     :param keyfile: Location of the private key file for the server.
         Defaults to '.ssh_cli_key' in the user home directory.
         A new key will be generated if the keyfile does not exist.
+    :param reuse_port: Set the *SO_REUSEPORT* socket option so that multiple worker processes
+        can listen on the same port. The kernel then distributes incoming connections between them.
+        Not available on Windows. Defaults to :code:`False`.
+
+    .. note::
+
+        When running multiple workers the host key must exist before the workers are started,
+        otherwise each worker would generate (and write) its own key.
+        Call :meth:`load_host_key` once in the parent process before forking.
+        Also note that the :code:`shutdown` command will only stop the worker handling the connection.
     """
 
-    def __init__(self, cli: BaseCLI, port: int = 8222, keyfile: str = None):
+    def __init__(self, cli: BaseCLI, port: int = 8222, keyfile: str = None, reuse_port: bool = False):
         self.cli = cli
         self.port = port
+        self.reuse_port = reuse_port
         self.is_running: Event = asyncio.Event()
 
         if keyfile:
@@ -387,6 +547,7 @@ class SshCLIServer:
             self.host_keyfile = os.path.join(homedir, '.ssh_cli_key')
 
         self._ssh_server = None
+        self._host_key: Optional[asyncssh.SSHKey] = None
 
     @property
     def ssh_server(self) -> asyncssh.SSHAcceptor:
@@ -395,27 +556,47 @@ class SshCLIServer:
     async def close(self):
         self._ssh_server.close()
 
-    def _get_host_key(self) -> asyncssh.SSHKey:
+    async def _get_host_key(self) -> asyncssh.SSHKey:
+        """
+        Get the private key for the SSH server.
+
+        The key file is read (or a new key generated and written) in a worker thread
+        so that the blocking file access does not stall the event loop.
+
+        :return: the private key for the ssh server
+        """
+        if self._host_key:
+            return self._host_key
+
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self.load_host_key)
+
+    def load_host_key(self) -> asyncssh.SSHKey:
         """
         Load the private key for the SSH server.
 
         If the key file does not exist or is not a valid key a new private key is generated and
         saved.
 
+        The key is only loaded once and then cached, so restarting the server (or forking workers
+        after the first call) does not read and parse the key file again.
+
         :return: the private key for the ssh server
         """
+        if self._host_key:
+            return self._host_key
+
         try:
             key = asyncssh.read_private_key(self.host_keyfile)
         except (FileNotFoundError, asyncssh.KeyImportError):
             key = asyncssh.generate_private_key('ssh-rsa', 'SSH Server Host Key for ssh_cli_demo')
             try:
-                keyfile = open(self.host_keyfile, 'wb')
-                keyfile.write(key.export_private_key())
-                keyfile.close()
+                Path(self.host_keyfile).write_bytes(key.export_private_key())
                 print(f"SSH Server: New private host key generated and saved as {self.host_keyfile}")
             except Exception as exc:
                 print(f"SSH Server: could not write host key to {self.host_keyfile}. Reason: {exc}")
 
+        self._host_key = key
         return key
 
     async def run_server(self) -> None:
@@ -433,7 +614,9 @@ class SshCLIServer:
             lambda: PromptToolkitSSHServer(self.cli.cmdloop),
             "",
             self.port,
-            server_host_keys=self._get_host_key(),
+            server_host_keys=await self._get_host_key(),
+            reuse_address=True,
+            reuse_port=self.reuse_port,
         )
 
         # at this point the server is running. Inform interessted listeners.
@@ -445,8 +628,27 @@ class SshCLIServer:
 
 
 if __name__ == "__main__":
+    import argparse
+
+    argparser = argparse.ArgumentParser(description="argparseDecorator SSH CLI demo")
+    argparser.add_argument("--workers", "-w", type=int, default=1,
+                           help="number of server processes sharing the port (requires SO_REUSEPORT)")
+    workers = argparser.parse_args().workers
+
     democli = DemoCLI()
-    server = SshCLIServer(cli=democli, port=8301)
+    server = SshCLIServer(cli=democli, port=8301, reuse_port=workers > 1)
+
+    worker_pids: List[int] = []
+    if workers > 1:
+        # load the host key before forking, so that all workers inherit the same (already parsed) key.
+        server.load_host_key()
+        for _ in range(workers - 1):
+            pid = os.fork()
+            if pid == 0:
+                # child process: do not fork any further, the other workers are not our children
+                worker_pids.clear()
+                break
+            worker_pids.append(pid)
 
 
     async def start_server():
@@ -455,16 +657,21 @@ if __name__ == "__main__":
         # wait until the server has started.
         await server.is_running.wait()
 
-        print("SSH Server started on port 8301")
+        print(f"SSH Server started on port 8301 (pid {os.getpid()})")
 
         # Get the ssh_server reference.
         # This is passed on to the CLI so that the CLI can shut down the server if required.
         ssh_server: asyncssh.SSHAcceptor = server.ssh_server
         democli.sshserver = ssh_server
 
-        await asyncio.gather(ssh_task)  # run until the _ssh_server is closed
+        await ssh_task  # run until the _ssh_server is closed
 
         print("SSH Server terminated.")
 
 
-    asyncio.run(start_server())
+    try:
+        asyncio.run(start_server())
+    finally:
+        # the parent process waits for its workers, so that they do not linger as zombies.
+        for pid in worker_pids:
+            os.waitpid(pid, 0)
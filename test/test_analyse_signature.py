@@ -1,6 +1,7 @@
 from __future__ import annotations
 
 import argparse
+import sys
 import unittest
 from argparse import FileType
 from typing import Union, Literal
@@ -8,6 +9,7 @@ from typing import Union, Literal
 from argparsedecorator.annotations import *
 from argparsedecorator.argparse_decorator import Argument
 from argparsedecorator.argparse_decorator import ParserNode
+from argparsedecorator.parsernode import annotation_steps
 
 
 class MyAction(argparse.Action):
@@ -26,6 +28,15 @@ class TestSignatureParser(unittest.TestCase):
         self.assertEqual('arg1', arg.name)
         self.assertIsNone(arg.type)
 
+    def test_analyse_signature_variadic(self):
+        def test(self, arg1, *rest: str, **options: str):
+            return arg1, rest, options
+
+        node = ParserNode("test")
+        node.analyse_signature(test)
+        self.assertListEqual(["arg1"], list(node.arguments))
+        self.assertTrue(node.bound_method)
+
     def test_analyse_signature_flag_option(self):
         def test(arg1: Flag = True, arg2: Option = False):
             return arg1, arg2
@@ -61,6 +72,17 @@ class TestSignatureParser(unittest.TestCase):
         arg: Argument = node.arguments['arg1']
         self.assertEqual(MyAction, arg.action)
 
+        if sys.version_info >= (3, 9):
+            # BooleanOptionalAction handles a bool default itself, no implied store_true
+            def test3(arg1: Option | CustomAction[argparse.BooleanOptionalAction] = False):
+                return arg1
+
+            node = ParserNode("test")
+            node.function = test3
+            arg: Argument = node.arguments['--arg1']
+            self.assertIs(argparse.BooleanOptionalAction, arg.action)
+            self.assertIs(False, arg.default)
+
     def test_analyse_signature_choices(self):
         def test1(arg1: Choices[Literal["foo", "bar"]] = "foo"):
             return arg1
@@ -114,6 +136,24 @@ class TestSignatureParser(unittest.TestCase):
             node.analyse_annotation("Union[int, ZeroOrOne[float]]", arg)
             self.fail()
 
+    def test_annotation_steps(self):
+        steps = annotation_steps("Union[int, OneOrMore]")
+        self.assertEqual((("eval_type", "int"), ("nargs", "+")), steps)
+        self.assertIs(steps, annotation_steps("Union[int, OneOrMore]"))  # cached
+
+        # the cached steps are evaluated with the globals of each node
+        node1 = ParserNode("test1")
+        node1.function_globals = {"MyType": int}
+        node2 = ParserNode("test2")
+        node2.function_globals = {"MyType": float}
+        arg1 = Argument("arg1")
+        arg2 = Argument("arg2")
+        node1.analyse_annotation("MyType | Flag", arg1)
+        node2.analyse_annotation("MyType | Flag", arg2)
+        self.assertEqual(int, arg1.type)
+        self.assertEqual(float, arg2.type)
+        self.assertEqual("-arg2", arg2.name)
+
     def test_analyse_annotation_part(self):
         node = ParserNode("test")
         node.function_globals = globals()
@@ -11,8 +11,10 @@
 from __future__ import annotations
 
 import argparse
+import functools
 import io
 import pathlib
+import sys
 import unittest
 from typing import Literal
 
@@ -23,6 +25,21 @@ from argparsedecorator.argparse_decorator import *
 
 class TestSync(unittest.TestCase):
 
+    # Parser shared by the tests that only execute commands
+
+    @classmethod
+    def setUpClass(cls):
+        cls.io_parser = ArgParseDecorator()
+
+        @cls.io_parser.command
+        def echo(text: str):
+            print(text)
+
+        @cls.io_parser.command
+        def inp():
+            text = input()
+            print(text)
+
     def test_init(self):
         apd = ArgParseDecorator()
         self.assertIsNotNone(apd)
@@ -286,11 +303,7 @@ class TestSync(unittest.TestCase):
             self.parser.execute("foobar 101")
 
     def test_output_redirect(self):
-        parser = ArgParseDecorator()
-
-        @parser.command
-        def echo(text: str):
-            print(text)
+        parser = self.io_parser
 
         stdout = io.StringIO()
         stderr = io.StringIO()
@@ -309,12 +322,7 @@ class TestSync(unittest.TestCase):
         self.assertTrue(len(stderr.getvalue()) > 10)
 
     def test_input_redirect(self):
-        parser = ArgParseDecorator()
-
-        @parser.command
-        def inp():
-            text = input()
-            print(text)
+        parser = self.io_parser
 
         stdin = io.StringIO("foobar\n")
         stdout = io.StringIO()
@@ -322,20 +330,39 @@ class TestSync(unittest.TestCase):
         parser.execute("inp", stdin=stdin, stdout=stdout)
         self.assertTrue(stdout.getvalue().startswith("foobar"))
 
+    def test_stdio_redirect(self):
+        stdout = io.StringIO()
+        old_stdin, old_stderr = sys.stdin, sys.stderr
+        redirect = StdioRedirect(stdout=stdout)
+        for _ in range(2):  # can be reused
+            with redirect:
+                print("foo")
+                self.assertIs(old_stdin, sys.stdin)
+                self.assertIs(old_stderr, sys.stderr)
+            self.assertIsNot(stdout, sys.stdout)
+        self.assertEqual("foo\nfoo\n", stdout.getvalue())
+
     def test_split_commandline(self):
-        # string cmdline
-        self.assertEqual(["foo", "bar", "baz"], split_commandline("foo bar baz"))
-        self.assertEqual(["foo", "bar", "baz"], split_commandline("  foo  bar  baz  "))
-        self.assertEqual(["foo", "bar baz"], split_commandline('foo "bar baz"'))
-        self.assertEqual(['cmd', "'foo bar'"], split_commandline('cmd "\'foo bar\'"'))
-        # check correct whitespace split
-        self.assertEqual(["foo", "-f", "--v"], split_commandline("foo -f --v"))
-
-        # list commandline
-        self.assertEqual(["foo", "bar", "baz"], split_commandline(["foo", "bar", "baz"]))
-        self.assertEqual(["foo", "bar baz"], split_commandline(["foo", "bar baz"]))
-        self.assertEqual(["foo", "bar baz"], split_commandline([str(Path("some/path/foo")), "bar baz"]))
-        self.assertEqual(["foo", "'bar baz'"], split_commandline([str(Path("some/path/foo.py")), "\'bar baz\'"]))
+        cases = [
+            # string cmdline
+            ("foo bar baz", ["foo", "bar", "baz"]),
+            ("  foo  bar  baz  ", ["foo", "bar", "baz"]),
+            ('foo "bar baz"', ["foo", "bar baz"]),
+            ('cmd "\'foo bar\'"', ['cmd', "'foo bar'"]),
+            # check correct whitespace split
+            ("foo -f --v", ["foo", "-f", "--v"]),
+            ("foo\tbar\r\nbaz\n", ["foo", "bar", "baz"]),
+            ("foo #bar", ["foo"]),
+            ("   ", []),
+            # list commandline
+            (["foo", "bar", "baz"], ["foo", "bar", "baz"]),
+            (["foo", "bar baz"], ["foo", "bar baz"]),
+            ([str(Path("some/path/foo")), "bar baz"], ["foo", "bar baz"]),
+            ([str(Path("some/path/foo.py")), "\'bar baz\'"], ["foo", "'bar baz'"]),
+        ]
+        for cmdline, expected in cases:
+            with self.subTest(cmdline=cmdline):
+                self.assertEqual(expected, split_commandline(cmdline))
 
         # iterator commandline
         lexer = shlex("foo bar baz")
@@ -358,11 +385,16 @@ class TestSync(unittest.TestCase):
             """
             return debug, foo
 
+        # resolved when the command is decorated, not when the help is shown
+        self.assertEqual(argparse.SUPPRESS, cli.rootnode.get_node("test").arguments["--debug"].help)
+        parser = cli.argumentparser
+
         stdout = io.StringIO()
         stderr = io.StringIO()
         cli.execute("help test", stdout=stdout, stderr=stderr)
         helptext = stdout.getvalue()
         self.assertFalse("debug" in helptext)
+        self.assertIs(parser, cli.argumentparser)  # showing the help does not regenerate anything
 
     def test_argparse_help_argparse(self):
         cli = ArgParseDecorator(helpoption="-h")
@@ -440,6 +472,13 @@ class TestSync(unittest.TestCase):
         cmds = cli.command_dict
         self.assertIsNotNone(cmds)
         self.assertDictEqual({"help": None, "cmd": {"on": None, "off": None}}, cmds)
+        self.assertIs(cmds, cli.command_dict)  # cached
+
+        @cli.command
+        def cmd_on_now():
+            pass
+
+        self.assertDictEqual({"help": None, "cmd": {"on": {"now": None}, "off": None}}, cli.command_dict)
 
     def test_command_aliases(self):
         cli = ArgParseDecorator()
@@ -477,6 +516,44 @@ class TestSync(unittest.TestCase):
             def test3() -> None:
                 pass
 
+    def test_memoize(self):
+        cli = ArgParseDecorator()
+        calls = []
+
+        @cli.command(memoize=True)
+        def square(value: int) -> int:
+            calls.append(value)
+            return value * value
+
+        @cli.command(memoize=2)
+        def total(values: OneOrMore[int]) -> int:
+            calls.append(values)
+            return sum(values)
+
+        self.assertEqual(4, cli.execute("square 2"))
+        self.assertEqual(4, cli.execute("square 2"))
+        self.assertEqual(9, cli.execute("square 3"))
+        self.assertListEqual([2, 3], calls)
+
+        cli.clear_memo("square")
+        self.assertEqual(4, cli.execute("square 2"))
+        self.assertListEqual([2, 3, 2], calls)
+
+        # lists are not hashable and are never cached
+        calls.clear()
+        self.assertEqual(3, cli.execute("total 1 2"))
+        self.assertEqual(3, cli.execute("total 1 2"))
+        self.assertEqual(2, len(calls))
+
+        with self.assertRaises(ValueError):
+            cli.clear_memo("foobar")
+
+        with self.assertRaises(ValueError):
+            @cli.command(memoize=True)
+            async def coro():
+                pass
+        self.assertFalse(cli.rootnode.has_node("coro"))  # not added half-configured
+
     def test_ignore_annotations(self):
         cli = ArgParseDecorator()
 
@@ -563,6 +640,22 @@ class TestAsync(unittest.IsolatedAsyncioTestCase):
         result = await cli.execute_async("test2")
         self.assertEqual(43, result)
 
+        # an asynchronous function behind a functools.wraps decorator
+        def logged(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                return func(*args, **kwargs)
+
+            return wrapper
+
+        @cli.command
+        @logged
+        async def test3() -> int:
+            return 44
+
+        result = await cli.execute_async("test3")
+        self.assertEqual(44, result)
+
     async def test_async_redirect(self):
         cli = ArgParseDecorator()
 
@@ -1,7 +1,9 @@
 import argparse
+import sys
 import unittest
 
 from argparsedecorator.argparse_decorator import Argument
+from argparsedecorator.argument import evaluate_choices, compile_expression
 
 
 class MyTestCase(unittest.TestCase):
@@ -14,6 +16,13 @@ class MyTestCase(unittest.TestCase):
         with self.assertRaises(ValueError):
             arg.name = "1foobar"
 
+        arg.name = "--" + "".join(["b", "ar"])  # not a constant, so not interned by the compiler
+        self.assertIs(sys.intern("--bar"), arg.name)
+
+        self.assertFalse(hasattr(arg, "__dict__"))  # __slots__ only
+        with self.assertRaises(AttributeError):
+            arg.foobar = "not a slot"
+
     def test_alias(self):
         arg = Argument("--alias")
         self.assertFalse(arg.alias)
@@ -21,6 +30,8 @@ class MyTestCase(unittest.TestCase):
         self.assertEqual(['--foo'], arg.alias)
         arg.add_alias('-bar')
         self.assertEqual(['--foo', '-bar'], arg.alias)
+        arg.alias.append('-baz')  # the returned list is a copy
+        self.assertEqual(['--foo', '-bar'], arg.alias)
         with self.assertRaises(ValueError):
             arg.add_alias('baz')  # does not start with '-'
         self.assertEqual(["--alias", "--foo", "-bar"], arg.get_command_line()[0])
@@ -33,14 +44,6 @@ class MyTestCase(unittest.TestCase):
         arg.action = "store_true"
         self.assertEqual("store_true", arg.get_command_line()[1]["action"])
 
-        try:
-            arg = Argument("action")
-            arg.action = argparse.BooleanOptionalAction
-            self.assertEqual(argparse.BooleanOptionalAction, arg.get_command_line()[1]["action"])
-        except AttributeError:
-            # argparse.BooleanOptionalAction only in python 3.9 +
-            pass
-
         arg = Argument("action")
         arg.action = "store_true"
         with self.assertRaises(ValueError):
@@ -48,15 +51,22 @@ class MyTestCase(unittest.TestCase):
         with self.assertRaises(TypeError):
             Argument("action").action = 42
 
+    @unittest.skipUnless(sys.version_info >= (3, 9), "argparse.BooleanOptionalAction only in python 3.9+")
+    def test_action_boolean_optional(self):
+        arg = Argument("action")
+        arg.action = argparse.BooleanOptionalAction
+        self.assertEqual(argparse.BooleanOptionalAction, arg.get_command_line()[1]["action"])
+
     def test_nargs(self):
         arg = Argument("nargs")
         arg.nargs = 10
         self.assertEqual(10, arg.get_command_line()[1]["nargs"])
 
         for s in ['?', '*', '+']:
-            arg = Argument("nargs")
-            arg.nargs = s
-            self.assertEqual(s, arg.get_command_line()[1]["nargs"])
+            with self.subTest(nargs=s):
+                arg = Argument("nargs")
+                arg.nargs = s
+                self.assertEqual(s, arg.get_command_line()[1]["nargs"])
 
         with self.assertRaises(ValueError):
             Argument("nargs").nargs = 0
@@ -64,20 +74,24 @@ class MyTestCase(unittest.TestCase):
             Argument("nargs").nargs = "foo"
         with self.assertRaises(ValueError):
             Argument("nargs").nargs = 4.3
+        with self.assertRaises(ValueError):
+            Argument("nargs").nargs = ["+"]
         with self.assertRaises(ValueError):
             arg = Argument("nargs")
             arg.nargs = '?'
             arg.nargs = 2
 
     def test_type(self):
-        arg = Argument("type")
+        for argtype, expected in [("int", int), ("builtins.int", int), (float, float)]:
+            with self.subTest(type=argtype):
+                arg = Argument("type")
+                arg.type = argtype
+                self.assertEqual(expected, arg.type)
+                self.assertEqual(expected, arg.get_command_line()[1]["type"])
+
+        arg = Argument("type", {"int": float})  # names are resolved like eval(), globals before builtins
         arg.type = "int"
-        self.assertEqual(int, arg.type)
-        self.assertEqual(int, arg.get_command_line()[1]["type"])
-
-        arg = Argument("type")
-        arg.type = float
-        self.assertEqual(float, arg.get_command_line()[1]["type"])
+        self.assertIs(float, arg.type)
 
         arg = Argument("type", globals())
         arg.type = "argparse.FileType('w')"
@@ -105,21 +119,14 @@ class MyTestCase(unittest.TestCase):
             arg.default = 123
 
     def test_choices(self):
-        arg = Argument("choices")
-        arg.choices = "10, 20, 30"
-        self.assertEqual((10, 20, 30), arg.get_command_line()[1]["choices"])
-
-        arg = Argument("choices")
-        arg.choices = "'foo', 'bar', 42"
-        self.assertEqual(('foo', 'bar', 42), arg.get_command_line()[1]["choices"])
-
-        arg = Argument("choices")
-        arg.choices = "range(1,4)"
-        self.assertEqual(range(1, 4), arg.get_command_line()[1]["choices"])
-
-        arg = Argument("choices")
-        arg.choices = range(2, 5)
-        self.assertEqual(range(2, 5), arg.get_command_line()[1]["choices"])
+        for choices, expected in [("10, 20, 30", (10, 20, 30)),
+                                  ("'foo', 'bar', 42", ('foo', 'bar', 42)),
+                                  ("range(1,4)", range(1, 4)),
+                                  (range(2, 5), range(2, 5))]:
+            with self.subTest(choices=choices):
+                arg = Argument("choices")
+                arg.choices = choices
+                self.assertEqual(expected, arg.get_command_line()[1]["choices"])
 
         arg = Argument("choices")
         with self.assertRaises(ValueError):
@@ -130,6 +137,18 @@ class MyTestCase(unittest.TestCase):
         with self.assertRaises(ValueError):
             arg.choices = "'a','b','c'"
 
+    def test_evaluate_choices(self):
+        # parsed directly, must give the same result as eval()
+        for expression in ["10, 20, 30", "'foo', \"bar\", -42", "'a,b',", "range(1, 10, 2)", "'', +1 ,"]:
+            with self.subTest(expression=expression):
+                self.assertEqual(eval(expression), evaluate_choices(expression, {}))
+
+        # everything else is evaluated
+        self.assertEqual((1.5, 2), evaluate_choices("1.5, 2", {}))
+        self.assertEqual([1, 2], evaluate_choices("values", {"values": [1, 2]}))
+        self.assertEqual([3], evaluate_choices(" values ", {"values": [3]}))  # same code, other globals
+        self.assertIs(compile_expression("values"), compile_expression("values"))  # cached
+
     def test_required(self):
         arg = Argument("required")
         arg.required = True
@@ -181,21 +200,33 @@ class MyTestCase(unittest.TestCase):
         with self.assertRaises(NotImplementedError):
             arg.dest = "foobar"
 
+    def test_get_command_line(self):
+        arg = Argument("-f")
+        self.assertEqual((["-f"], {}), arg.get_command_line())
+        self.assertIs(arg.get_command_line(), arg.get_command_line())  # cached
+
+        # any change must invalidate the cached command line
+        arg.add_alias("--foo")
+        self.assertEqual((["-f", "--foo"], {"dest": "f"}), arg.get_command_line())
+        arg.nargs = 2
+        arg.type = int
+        arg.help = "help"
+        self.assertEqual({"nargs": 2, "type": int, "help": "help", "dest": "f"}, arg.get_command_line()[1])
+        arg.type = None
+        self.assertNotIn("type", arg.get_command_line()[1])
+
     def test_argument_from_args(self):
 
         arg = Argument.argument_from_args("foo", action="action", nargs=1, const="const", default="default",
                                           type=str, choices=("1", "2"), required=True, help="help",
                                           metavar="metavar")
-        self.assertEqual("foo", arg.name)
-        self.assertEqual("action", arg.action)
-        self.assertEqual(1, arg.nargs)
-        self.assertEqual("const", arg.const)
-        self.assertEqual("default", arg.default)
-        self.assertTrue(arg.type is str)
-        self.assertCountEqual(("1", "2"), arg.choices)
-        self.assertTrue(arg.required)
-        self.assertEqual("help", arg.help)
-        self.assertEqual("metavar", arg.metavar)
+        self.assertEqual((["foo"], {"action": "action", "nargs": 1, "const": "const", "default": "default",
+                                    "type": str, "choices": ("1", "2"), "required": True, "help": "help",
+                                    "metavar": "metavar"}),
+                         arg.get_command_line())
+        # the keyword arguments keep the order of the add_argument() signature
+        self.assertEqual(["action", "nargs", "const", "default", "type", "choices", "required", "help", "metavar"],
+                         list(arg.get_command_line()[1]))
 
         arg: Argument = Argument.argument_from_args("-f", "--foo", "--foobar")
         self.assertEqual("--foo", arg.name)
@@ -205,6 +236,10 @@ class MyTestCase(unittest.TestCase):
         self.assertEqual("-f", arg.name)
         self.assertEqual(["-flag"], arg.alias)
 
+        arg = Argument.argument_from_args("foo", _nargs=0, positional=False)  # only public properties are set
+        self.assertIsNone(arg.nargs)
+        self.assertTrue(arg.positional)
+
         with self.assertRaises(ValueError):
             Argument.argument_from_args(action="foobar")  # no name
         with self.assertRaises(ValueError):
@@ -3,6 +3,7 @@ import unittest
 
 from argparsedecorator.argparse_decorator import Argument
 from argparsedecorator.argparse_decorator import ParserNode
+from argparsedecorator.parsernode import docstring_directives
 
 
 class MyTestCase(unittest.TestCase):
@@ -22,6 +23,20 @@ class MyTestCase(unittest.TestCase):
         node.analyse_docstring(self.test_multiline_description)
         self.assertEqual("foo bar", node.description)
 
+    def test_docstring_directives(self):
+        docstring = """
+        foo
+        bar
+
+        :param foo: help for foo
+        :alias foo: f
+        baz is not part of the description
+        """
+        description, directives = docstring_directives(docstring)
+        self.assertEqual("foo bar", description)
+        self.assertEqual(((":param", "foo: help for foo"), (":alias", "foo: f")), directives)
+        self.assertIs(directives, docstring_directives(docstring)[1])  # cached
+
     def test_simple_argument(self, foo=None):
         """:param foo: bar"""
         _ = foo
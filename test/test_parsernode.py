@@ -5,13 +5,15 @@
 # This work is licensed under the terms of the MIT license.
 # For a copy, see the accompaning LICENSE.txt.txt file or go to <https://opensource.org/licenses/MIT>.
 import argparse
+import sys
 import unittest
-from typing import Literal
+from typing import Any, Literal, Union
 
 from argparsedecorator import NonExitingArgumentParser
 from argparsedecorator.argparse_decorator import Argument
 from argparsedecorator.argparse_decorator import ParserNode
-from argparsedecorator.parsernode import resolve_literals, split_union, fullname
+from argparsedecorator.parsernode import resolve_literals, split_union, split_top_level, fullname, get_signature, \
+    SIGNATURE_CACHE
 from argparsedecorator.annotations import *
 
 
@@ -20,6 +22,7 @@ class MyTestCase(unittest.TestCase):
     def test_properies(self):
         node = ParserNode("test")
         self.assertEqual("test", node.title)
+        self.assertFalse(hasattr(node, "__dict__"))  # __slots__ only
         with self.assertRaises(AttributeError):
             # noinspection PyPropertyAccess
             node.title = "foobar"  # read only property
@@ -32,7 +35,7 @@ class MyTestCase(unittest.TestCase):
             # noinspection PyPropertyAccess
             node.root = tmpnode  # read only property
 
-        self.assertTrue(type(tmpnode.argparser_class) is type(NonExitingArgumentParser))  # default
+        self.assertIs(NonExitingArgumentParser, tmpnode.argparser_class)  # default
         tmpnode.argparser_class = argparse.ArgumentParser
         # can't use AssertIsInstance because NonExitingArgumentParser is an instance of ArgumentParser
         self.assertTrue(node.argparser_class is argparse.ArgumentParser)
@@ -55,7 +58,7 @@ class MyTestCase(unittest.TestCase):
         testnode = node.get_node("test")
         testnode.function = test
         self.assertEqual(test, testnode.function)
-        self.assertCountEqual(globals(), testnode.function_globals)
+        self.assertIs(test.__globals__, testnode.function_globals)  # the live module dict, not a copy
         testnode.function_globals = {"foo": 1}
         self.assertEqual({"foo": 1}, testnode.function_globals)
         with self.assertRaises(TypeError):
@@ -64,10 +67,11 @@ class MyTestCase(unittest.TestCase):
         # setting a new parser
         rootnode = testnode.root
         rootnode.generate_parser(None)  # generate the parser to check that it is regenerated upon setting a new parser
-        self.assertEqual(type(NonExitingArgumentParser), type(rootnode.argparser_class))
+        self.assertIs(argparse.ArgumentParser, rootnode.argparser_class)
 
-        testnode.argparser_class = argparse.ArgumentParser
-        self.assertEqual(type(argparse.ArgumentParser), type(rootnode.argparser_class))
+        testnode.argparser_class = NonExitingArgumentParser
+        self.assertIs(NonExitingArgumentParser, rootnode.argparser_class)
+        self.assertIs(NonExitingArgumentParser, type(rootnode.argumentparser))  # regenerated
 
     def test_add_help(self):
         node = ParserNode("test")
@@ -86,6 +90,22 @@ class MyTestCase(unittest.TestCase):
         subchildnode = node.get_node(["helptest", "helptest2"])
         self.assertEqual(True, subchildnode.add_help)
 
+    def test_parser_cache(self):
+        root = ParserNode(None)
+        node = root.get_node("cmd")
+        parser = root.argumentparser
+        self.assertIs(parser, root.argumentparser)  # reused while nothing changes
+
+        node.add_argument(Argument("--foo"))
+        self.assertIsNot(parser, root.argumentparser)  # new argument
+        self.assertEqual("bar", root.argumentparser.parse_args(["cmd", "--foo", "bar"]).foo)
+
+        parser = root.argumentparser
+        subparser = node.argumentparser
+        node.aliases = "c"
+        self.assertIsNot(parser, root.argumentparser)  # new alias
+        self.assertIsNot(subparser, node.argumentparser)  # child parsers are regenerated as well
+
     def test_coroutine(self):
         root = ParserNode(None)
 
@@ -137,6 +157,10 @@ class MyTestCase(unittest.TestCase):
         node.add_arguments([Argument("c"), Argument("d")])
         self.assertCountEqual(["a", "b", "c", "d"], node.arguments.keys())
 
+        with self.assertRaises(TypeError):
+            # noinspection PyUnresolvedReferences
+            node.arguments["e"] = Argument("e")  # read only
+
         self.assertIsNotNone(node.get_argument("a"))
         self.assertIsNone(node.get_argument("foo"))
 
@@ -169,6 +193,8 @@ class MyTestCase(unittest.TestCase):
         # Literal with List
         self.assertCountEqual([1, 2, 3], eval(resolve_literals("Literal[[1, 2, 3]]")))
 
+        self.assertIs(resolve_literals(str(foobar)), resolve_literals(str(foobar)))  # cached
+
     def test_split_union(self):
         self.assertListEqual(["foo"], split_union("foo"))
         self.assertListEqual(["foo", "bar"], split_union("foo, bar"))
@@ -179,6 +205,75 @@ class MyTestCase(unittest.TestCase):
         self.assertListEqual(["bar{1,2,3}", "baz['test'])"],
                              split_union("bar{1,2,3} , baz['test'])"))
 
+    def test_split_top_level(self):
+        self.assertListEqual(["int"], split_top_level("int", "|"))
+        self.assertListEqual(["int", "Flag"], split_top_level(" int |Flag ", "|"))
+        self.assertListEqual(["OneOrMore[int | float]", "Option"],
+                             split_top_level("OneOrMore[int | float] | Option", "|"))
+        self.assertListEqual(["Choices[('a', 'b')]", "Flag"], split_top_level("Choices[('a', 'b')], Flag", ","))
+
+    def test_get_signature(self):
+        def test(arg1: int, arg2: Flag = False):
+            return arg1, arg2
+
+        signature = get_signature(test)
+        self.assertEqual(["arg1", "arg2"], list(signature.parameters))
+        self.assertIs(signature, get_signature(test))  # cached
+        self.assertIn(test, SIGNATURE_CACHE)
+
+        self.assertIsNotNone(get_signature(len))  # builtins can not be cached, but must still work
+
+    def test_analyse_class_annotation(self):
+        class Local:
+            pass
+
+        node = ParserNode("test")
+        arg = Argument("foo")
+        node.analyse_annotation(Option, arg)
+        node.analyse_annotation(CountAction, arg)
+        self.assertEqual("--foo", arg.name)
+        self.assertEqual("count", arg.action)
+
+        arg = Argument("bar")
+        node.analyse_annotation(Local, arg)  # not resolvable by name, must be used directly
+        self.assertIs(Local, arg.type)
+
+        arg = Argument("baz")
+        node.analyse_annotation(Any, arg)
+        self.assertIsNone(arg.type)
+
+        arg = Argument("union")
+        node.analyse_annotation(Union[Local, Flag, Exactly2], arg)
+        self.assertEqual("-union", arg.name)
+        self.assertIs(Local, arg.type)
+        self.assertEqual(2, arg.nargs)
+
+        arg = Argument("typed")
+        node.analyse_annotation(Union[Option, OneOrMore[Local]], arg)
+        self.assertEqual("--typed", arg.name)
+        self.assertIs(Local, arg.type)
+        self.assertEqual("+", arg.nargs)
+
+        if sys.version_info >= (3, 10):
+            arg = Argument("bar_union")
+            node.analyse_annotation(Option | Local, arg)
+            self.assertEqual("--bar_union", arg.name)
+            self.assertIs(Local, arg.type)
+
+    def test_analyse_typed_annotation(self):
+        # runtime (non-string) annotations. This module does not use 'from __future__ import annotations'
+        def cmd(values: OneOrMore[int], pair: Union[Option, Exactly2[float]] = None):
+            return values, pair
+
+        node = ParserNode("test")
+        node.function = cmd
+        arg = node.get_argument("values")
+        self.assertIs(int, arg.type)
+        self.assertEqual("+", arg.nargs)
+        arg = node.get_argument("pair")
+        self.assertIs(float, arg.type)
+        self.assertEqual(2, arg.nargs)
+
     def test_fullname(self):
         self.assertEqual("str", fullname(str))
         self.assertEqual("argparsedecorator.annotations.Choices", fullname(Choices))
@@ -188,5 +283,5 @@ class MyTestCase(unittest.TestCase):
         # no_command is a dummy placeholder command that does nothing.
         # test is included here just to get coverage to 100%
         node = ParserNode("test")
-        self.assertEqual(node.function, node.no_command)
+        self.assertIs(ParserNode.no_command, node.function)  # shared by all nodes
         self.assertIsNone(node.no_command(dummy="foo", arg="bar"))